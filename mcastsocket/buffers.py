@@ -0,0 +1,142 @@
+"""Adaptive receive buffer sizing driven by kernel drop counters
+
+Rather than hand-tuning SO_RCVBUF for each host, an AdaptiveBuffer watches
+the number of datagrams the kernel dropped on the socket because its
+receive buffer was full and grows the buffer (up to a cap) when drops
+appear.
+
+Drop counts come from either:
+
+* SO_RXQ_OVFL ancillary data, if you receive with recvmsg, pass the
+  ancillary data to observe() (cheapest, no extra syscalls)
+* the drops column of /proc/net/udp (udp6) for the socket's inode, read
+  by check()
+
+.. code-block:: python
+
+    sock = mcastsocket.create_socket(('', PORT), rcvbuf=256 * 1024)
+    adaptive = buffers.AdaptiveBuffer(sock, maximum=16 * 1024 * 1024)
+    while True:
+        readable, _, _ = select.select([sock], [], [], 1.0)
+        ...
+        adaptive.check()
+"""
+import logging
+import os
+import socket
+import struct
+import time
+from . import mcastsocket
+log = logging.getLogger(__name__)
+
+if not hasattr(socket, 'SO_RXQ_OVFL'):
+    socket.SO_RXQ_OVFL = 40
+DROP_COUNTER = struct.Struct('@I')
+
+
+def enable_drop_counter(sock):
+    """Ask the kernel to report the drop counter as recvmsg ancillary data"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RXQ_OVFL, 1)
+    return socket.CMSG_SPACE(DROP_COUNTER.size)
+
+
+def parse_drop_counter(ancdata):
+    """Extract SO_RXQ_OVFL drop counter from recvmsg ancdata (or None)"""
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SO_RXQ_OVFL:
+            return DROP_COUNTER.unpack_from(data)[0]
+    return None
+
+
+def proc_drops(sock, base='/proc/net'):
+    """Read the drop counter for sock from /proc/net/udp or udp6
+
+    returns None if the socket (or the file) cannot be found
+    """
+    inode = str(os.fstat(sock.fileno()).st_ino)
+    name = 'udp6' if sock.family == socket.AF_INET6 else 'udp'
+    try:
+        with open(os.path.join(base, name)) as stream:
+            next(stream)
+            for line in stream:
+                fields = line.split()
+                if len(fields) > 12 and fields[9] == inode:
+                    return int(fields[12])
+    except (IOError, OSError) as err:
+        log.debug('Unable to read drop counters: %s', err)
+    return None
+
+
+class AdaptiveBuffer(object):
+    """Grow a socket's receive buffer when the kernel reports drops
+
+    * sock -- socket as from mcastsocket.create_socket
+    * maximum -- largest receive buffer to request (bytes)
+    * factor -- multiplier applied to the buffer on each growth
+    * interval -- minimum seconds between growth steps, giving the new
+                  size time to take effect before growing again
+    """
+
+    def __init__(
+        self, sock, maximum=16 * 1024 * 1024, factor=2.0, interval=1.0,
+    ):
+        self.sock = sock
+        self.maximum = maximum
+        self.factor = factor
+        self.interval = interval
+        # what the kernel applied, it reports double this
+        self.size = max(mcastsocket.get_buffer_sizes(sock)[0] // 2, 1)
+        # set once the kernel stops honouring larger sizes
+        self.capped = False
+        self.drops = None
+        self.total_drops = 0
+        self.last_growth = 0
+        self.history = []
+
+    def observe(self, ancdata, now=None):
+        """Feed recvmsg ancillary data (requires enable_drop_counter)"""
+        drops = parse_drop_counter(ancdata)
+        if drops is None:
+            return None
+        return self.update(drops, now)
+
+    def check(self, now=None):
+        """Read the drop counter from /proc and grow if required"""
+        drops = proc_drops(self.sock)
+        if drops is None:
+            return None
+        return self.update(drops, now)
+
+    def update(self, drops, now=None):
+        """Process a cumulative drop counter value
+
+        returns the applied receive buffer size if it was grown, else None
+        """
+        previous, self.drops = self.drops, drops
+        if previous is None or drops <= previous:
+            return None
+        self.total_drops += drops - previous
+        if self.capped or self.size >= self.maximum:
+            return None
+        if now is None:
+            now = time.time()
+        if now - self.last_growth < self.interval:
+            return None
+        return self.grow(now)
+
+    def grow(self, now=None):
+        size = min(int(self.size * self.factor), self.maximum)
+        applied, _ = mcastsocket.set_buffer_sizes(self.sock, rcvbuf=size)
+        if applied // 2 <= self.size:
+            # capped (e.g. by net.core.rmem_max), asking again won't help
+            self.capped = True
+            return None
+        log.info(
+            'Receive buffer grown from %s to %s (requested %s) '
+            'after %s drops',
+            self.size, applied // 2, size, self.total_drops,
+        )
+        self.history.append((now, size, applied, self.total_drops))
+        self.size = applied // 2
+        self.last_growth = time.time() if now is None else now
+        return applied
@@ -0,0 +1,335 @@
+"""Capture and replay of multicast traffic
+
+Recorder writes received datagrams (with source, destination group and
+kernel receive timestamp) to an append-only pcap file (nanosecond
+resolution, raw IP link type) so captures can also be inspected with
+tcpdump/wireshark. Replay memory-maps a capture, indexes the records and
+re-publishes them through a socket at original timing, a multiple of it,
+or as fast as possible.
+
+.. code-block:: python
+
+    sock = mcastsocket.create_socket(('', PORT))
+    recorder = capture.Recorder('traffic.pcap', sock)
+    mcastsocket.join_group(sock, GROUP, iface='192.168.1.5')
+    while running:
+        select.select([sock], [], [])
+        recorder.receive()
+    recorder.close()
+
+    replay = capture.Replay('traffic.pcap')
+    sender = mcastsocket.create_socket(('', 0), TTL=1)
+    start = replay.seek(replay.start_time + 30.0)
+    replay.replay(sender, address=('224.1.1.10', PORT), speed=4.0, start=start)
+"""
+import array
+import bisect
+import logging
+import mmap
+import os
+import socket
+import struct
+import time
+from . import demux
+log = logging.getLogger(__name__)
+
+if not hasattr(socket, 'SO_TIMESTAMPNS'):
+    socket.SO_TIMESTAMPNS = 35
+SCM_TIMESTAMPNS = socket.SO_TIMESTAMPNS
+
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAP_HEADER = struct.Struct('=IHHiIII')
+RECORD_HEADER = struct.Struct('=IIII')
+LINKTYPE_RAW = 101
+TIMESPEC = struct.Struct('@qq')
+IPV4_HEADER = struct.Struct('!BBHHHBBH4s4s')
+IPV6_HEADER = struct.Struct('!IHBB16s16s')
+UDP_HEADER = struct.Struct('!HHHH')
+try:
+    # record offsets need 64 bits, 'L' is only 32 on LLP64 (Windows)
+    OFFSET_TYPE = array.array('Q').typecode
+except ValueError:
+    # python 2 has no 'Q'
+    OFFSET_TYPE = 'L'
+
+
+def enable_timestamps(sock):
+    """Ask the kernel for nanosecond receive timestamps (and pktinfo)"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_TIMESTAMPNS, 1)
+    demux.enable_pktinfo(sock)
+    return sock
+
+
+def recv_timestamped(sock, bufsize=65536):
+    """Receive a datagram with destination group and kernel timestamp
+
+    sock must have had enable_timestamps() called on it
+
+    returns (data, address, group, ifindex, timestamp), timestamp falls
+    back to time.time() if the kernel did not supply one
+    """
+    data, ancdata, _, address = sock.recvmsg(
+        bufsize,
+        demux.ancillary_size(sock) + socket.CMSG_SPACE(TIMESPEC.size),
+    )
+    timestamp = None
+    for level, kind, payload in ancdata:
+        if level == socket.SOL_SOCKET and kind == SCM_TIMESTAMPNS:
+            seconds, nanoseconds = TIMESPEC.unpack_from(payload)
+            timestamp = seconds + nanoseconds / 1e9
+    if timestamp is None:
+        timestamp = time.time()
+    group, ifindex = demux.parse_pktinfo(ancdata)
+    if group is not None:
+        group = socket.inet_ntop(sock.family, group)
+    return data, address, group, ifindex, timestamp
+
+
+def _checksum(header):
+    total = sum(struct.unpack('!%dH' % (len(header) // 2), header))
+    while total > 0xffff:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def ip_udp_header(source, destination, length, ttl=1):
+    """Build the synthetic IP+UDP headers for a captured datagram
+
+    source and destination are (ip, port) addresses
+    """
+    udp_length = UDP_HEADER.size + length
+    udp = UDP_HEADER.pack(source[1], destination[1], udp_length, 0)
+    if ':' in destination[0]:
+        ip = IPV6_HEADER.pack(
+            6 << 28, udp_length, socket.IPPROTO_UDP, ttl,
+            socket.inet_pton(socket.AF_INET6, source[0]),
+            socket.inet_pton(socket.AF_INET6, destination[0]),
+        )
+    else:
+        fields = [
+            0x45, 0, IPV4_HEADER.size + udp_length, 0, 0,
+            ttl, socket.IPPROTO_UDP, 0,
+            socket.inet_aton(source[0]), socket.inet_aton(destination[0]),
+        ]
+        fields[7] = _checksum(IPV4_HEADER.pack(*fields))
+        ip = IPV4_HEADER.pack(*fields)
+    return ip + udp
+
+
+class Record(object):
+    """A replayed datagram, payload is a memoryview into the capture
+
+    Copy the payload (bytes(record.payload)) if you need it after the
+    Replay is closed.
+    """
+    __slots__ = ('timestamp', 'source', 'destination', 'payload')
+
+    def __init__(self, timestamp, source, destination, payload):
+        self.timestamp = timestamp
+        self.source = source
+        self.destination = destination
+        self.payload = payload
+
+    def __repr__(self):
+        return '%s(%.9f, %r -> %r, %d bytes)' % (
+            self.__class__.__name__, self.timestamp,
+            self.source, self.destination, len(self.payload),
+        )
+
+
+class Recorder(object):
+    """Append received datagrams to a pcap capture file
+
+    * path -- capture file, appended to if it already exists
+    * sock -- optional socket to receive() from, timestamps are enabled on it
+    * snaplen -- maximum bytes of each datagram to store
+    """
+
+    def __init__(self, path, sock=None, snaplen=65535):
+        self.path = path
+        self.snaplen = snaplen
+        self.sock = sock
+        if sock is not None:
+            enable_timestamps(sock)
+            self.port = sock.getsockname()[1]
+        self.stream = open(path, 'ab')
+        if self.stream.tell() == 0:
+            self.stream.write(PCAP_HEADER.pack(
+                PCAP_MAGIC_NS, 2, 4, 0, 0, snaplen, LINKTYPE_RAW,
+            ))
+        self.count = 0
+
+    def receive(self, bufsize=65536):
+        """Receive one datagram from our socket and record it
+
+        returns (data, address) as for sock.recvfrom
+        """
+        data, address, group, _, timestamp = recv_timestamped(
+            self.sock, bufsize,
+        )
+        if group is None:
+            group = self.sock.getsockname()[0]
+        self.record(data, address, (group, self.port), timestamp)
+        return data, address
+
+    def record(self, data, source, destination, timestamp=None):
+        """Append a datagram sent from source to destination, (ip,port) each"""
+        if timestamp is None:
+            timestamp = time.time()
+        seconds = int(timestamp)
+        nanoseconds = int(round((timestamp - seconds) * 1e9))
+        if nanoseconds >= 1000000000:
+            seconds, nanoseconds = seconds + 1, nanoseconds - 1000000000
+        headers = ip_udp_header(source[:2], destination[:2], len(data))
+        stored = data[:max(self.snaplen - len(headers), 0)]
+        self.stream.write(RECORD_HEADER.pack(
+            seconds, nanoseconds,
+            len(headers) + len(stored), len(headers) + len(data),
+        ))
+        self.stream.write(headers)
+        self.stream.write(stored)
+        self.count += 1
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+
+
+class Replay(object):
+    """Memory-mapped, indexed capture for replay
+
+    The index holds the offset and timestamp of every record (in compact
+    arrays) so that seek() is a bisection and records are decoded only
+    as they are replayed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.map = self.view = None
+        self.stream = open(path, 'rb')
+        try:
+            size = os.fstat(self.stream.fileno()).st_size
+            if size < PCAP_HEADER.size:
+                raise ValueError('Not a capture file', path)
+            self.map = mmap.mmap(
+                self.stream.fileno(), 0, access=mmap.ACCESS_READ,
+            )
+            self.view = memoryview(self.map)
+            magic = struct.unpack_from('=I', self.map)[0]
+            if magic != PCAP_MAGIC_NS:
+                raise ValueError('Unsupported capture format', path, magic)
+            linktype = PCAP_HEADER.unpack_from(self.map)[6]
+            if linktype != LINKTYPE_RAW:
+                raise ValueError(
+                    'Unsupported capture link type', path, linktype,
+                )
+        except Exception:
+            self.close()
+            raise
+        self.offsets = array.array(OFFSET_TYPE)
+        self.timestamps = array.array('d')
+        self.build_index()
+
+    def build_index(self):
+        offset = PCAP_HEADER.size
+        size = len(self.map)
+        while offset + RECORD_HEADER.size <= size:
+            seconds, nanoseconds, length, _ = RECORD_HEADER.unpack_from(
+                self.map, offset,
+            )
+            if offset + RECORD_HEADER.size + length > size:
+                log.warning('Truncated record at offset %s', offset)
+                break
+            self.offsets.append(offset)
+            self.timestamps.append(seconds + nanoseconds / 1e9)
+            offset += RECORD_HEADER.size + length
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def start_time(self):
+        return self.timestamps[0] if self.timestamps else None
+
+    @property
+    def end_time(self):
+        return self.timestamps[-1] if self.timestamps else None
+
+    def seek(self, timestamp):
+        """Index of the first record at or after timestamp"""
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+    def __getitem__(self, index):
+        offset = self.offsets[index] + RECORD_HEADER.size
+        length = RECORD_HEADER.unpack_from(self.map, self.offsets[index])[2]
+        end = offset + length
+        if (self.map[offset] >> 4) == 6:
+            _, _, _, _, source, destination = IPV6_HEADER.unpack_from(
+                self.map, offset,
+            )
+            family = socket.AF_INET6
+            offset += IPV6_HEADER.size
+        else:
+            header_length = (self.map[offset] & 0x0f) * 4
+            source, destination = IPV4_HEADER.unpack_from(self.map, offset)[8:]
+            family = socket.AF_INET
+            offset += header_length
+        source_port, destination_port, _, _ = UDP_HEADER.unpack_from(
+            self.map, offset,
+        )
+        offset += UDP_HEADER.size
+        return Record(
+            self.timestamps[index],
+            (socket.inet_ntop(family, source), source_port),
+            (socket.inet_ntop(family, destination), destination_port),
+            self.view[offset:end],
+        )
+
+    def records(self, start=0, end=None):
+        if end is None:
+            end = len(self)
+        for index in range(start, end):
+            yield self[index]
+
+    def replay(self, sock, address=None, speed=1.0, start=0, end=None):
+        """Re-publish records on sock
+
+        * address -- (group,port) to send to, default the captured destination
+        * speed -- multiple of original timing, None or 0 for as fast as
+                   possible
+        * start, end -- record index range (see seek)
+
+        returns number of records sent
+        """
+        count = 0
+        origin = None
+        for record in self.records(start, end):
+            if speed:
+                if origin is None:
+                    origin = (time.time(), record.timestamp)
+                delay = origin[0] + (
+                    record.timestamp - origin[1]
+                ) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            sock.sendto(record.payload, address or record.destination)
+            count += 1
+        return count
+
+    def close(self):
+        """Close the capture
+
+        If Record payloads are still alive the mapping cannot be closed
+        yet, it is unmapped when the last of them is released.
+        """
+        if self.view is not None:
+            self.view.release()
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                log.debug('Record payloads still reference %s', self.path)
+        self.view = self.map = None
+        self.stream.close()
@@ -0,0 +1,297 @@
+"""Declarative channel plans with one-shot bulk socket setup
+
+Services that subscribe to hundreds of (group, port, iface, ssm, ttl)
+channels would otherwise call create_socket and join_group in a loop,
+canonicalising addresses and looking up interfaces on every call, and
+discovering a bad entry only after half the plan has been joined.
+
+A ChannelPlan instead:
+
+* validates and resolves every entry up front (addresses canonicalised
+  once, interface indices looked up once per interface), reporting every
+  bad entry together before any socket is created
+* groups entries onto one socket per (family, port), the channels
+  sharing a socket must therefore agree on TTL
+* creates the sockets and applies all joins in one pass using the
+  pre-built membership requests
+* closes everything it created if any step fails, so startup is
+  all-or-nothing
+
+.. code-block:: python
+
+    plan = channelplan.ChannelPlan([
+        ('224.1.1.2', 8000, '192.168.1.5'),
+        {'group': '232.1.1.3', 'port': 8000, 'iface': '192.168.1.5',
+         'ssm': '192.168.7.1'},
+        ('ff15::1', 8001, 'eth0'),
+    ], loop=False)
+    sockets = plan.open()
+    try:
+        readable, _, _ = select.select(sockets.sockets(), [], [])
+        ...
+    finally:
+        sockets.close()
+"""
+import collections
+import errno
+import logging
+import socket
+import struct
+from . import mcastsocket
+log = logging.getLogger(__name__)
+
+Channel = collections.namedtuple(
+    'Channel', ('group', 'port', 'iface', 'ssm', 'ttl'),
+)
+Channel.__new__.__defaults__ = ('', None, 1)
+
+
+class PlanError(ValueError):
+    """Raised with (index, entry, message) for every invalid plan entry"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(PlanError, self).__init__(
+            '%d invalid channel plan entries: %s' % (
+                len(errors),
+                '; '.join(
+                    '#%s %r: %s' % (index, entry, message)
+                    for index, entry, message in errors
+                ),
+            )
+        )
+
+
+class Resolved(object):
+    """A validated channel with its membership request pre-built"""
+    __slots__ = (
+        'channel', 'family', 'group', 'iface', 'ssm', 'level', 'option',
+        'leave', 'structure',
+    )
+
+    def __repr__(self):
+        return 'Resolved(%r)' % (self.channel,)
+
+
+def as_channel(entry):
+    if isinstance(entry, Channel):
+        return entry
+    if isinstance(entry, dict):
+        return Channel(**entry)
+    return Channel(*entry)
+
+
+def family_of(address):
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            return family, socket.inet_pton(family, address)
+        except (socket.error, ValueError, TypeError):
+            continue
+    raise ValueError('Not an IP address: %r' % (address,))
+
+
+def is_multicast(family, packed):
+    first = ord(packed[:1])
+    if family == socket.AF_INET:
+        return 224 <= first <= 239
+    return first == 0xff
+
+
+class ChannelPlan(object):
+    """Validated set of channels which can be opened in one pass
+
+    * entries -- Channel instances, (group, port[, iface[, ssm[, ttl]]])
+                 tuples or dictionaries of the same
+    * loop, reuse, rcvbuf, sndbuf -- passed to create_socket for each socket
+
+    raises PlanError listing every invalid entry
+    """
+
+    def __init__(
+        self, entries, loop=True, reuse=True, rcvbuf=None, sndbuf=None,
+    ):
+        self.loop = loop
+        self.reuse = reuse
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
+        self.channels = []
+        self.resolved = []
+        self.resolve(entries)
+
+    def resolve(self, entries):
+        errors = []
+        seen = set()
+        indices = {}
+        # (family, port): TTL, as the multicast TTL is per socket
+        ttls = {}
+        for index, entry in enumerate(entries):
+            try:
+                channel = as_channel(entry)
+                resolved = self.resolve_channel(channel, indices)
+            except (ValueError, TypeError, socket.error, IOError) as err:
+                errors.append((index, entry, str(err)))
+                continue
+            channel = resolved.channel
+            ttl = ttls.setdefault((resolved.family, channel.port), channel.ttl)
+            if ttl != channel.ttl:
+                errors.append((index, entry, (
+                    'TTL %s conflicts with TTL %s of other channels on '
+                    'port %s'
+                ) % (channel.ttl, ttl, channel.port)))
+                continue
+            key = (resolved.family, channel.port, resolved.structure)
+            if key in seen:
+                log.debug('Skipping duplicate channel %r', channel)
+                continue
+            seen.add(key)
+            self.channels.append(channel)
+            self.resolved.append(resolved)
+        if errors:
+            raise PlanError(errors)
+
+    def resolve_channel(self, channel, indices):
+        """Validate channel and build its membership request"""
+        # plans commonly come from config files, accept numeric strings
+        port, ttl = int(channel.port), int(channel.ttl)
+        if not 0 < port < 65536:
+            raise ValueError('Invalid port %r' % (channel.port,))
+        if not 0 <= ttl < 256:
+            raise ValueError('Invalid TTL %r' % (channel.ttl,))
+        channel = channel._replace(port=port, ttl=ttl)
+        family, group = family_of(channel.group)
+        if not is_multicast(family, group):
+            raise ValueError('%s is not a multicast group' % (channel.group,))
+        resolved = Resolved()
+        resolved.channel = channel
+        resolved.family = family
+        resolved.group = socket.inet_ntop(family, group)
+        resolved.ssm = None
+        if family == socket.AF_INET:
+            iface = mcastsocket.canonical(family, channel.iface or '')
+            resolved.iface = iface
+            structure = group + socket.inet_pton(family, iface)
+            resolved.level = socket.IPPROTO_IP
+            if channel.ssm:
+                ssm_family, ssm = family_of(channel.ssm)
+                if ssm_family != family:
+                    raise ValueError('SSM source family does not match group')
+                resolved.ssm = socket.inet_ntop(family, ssm)
+                structure += ssm
+                resolved.option = socket.IP_ADD_SOURCE_MEMBERSHIP
+                resolved.leave = socket.IP_DROP_SOURCE_MEMBERSHIP
+            else:
+                resolved.option = socket.IP_ADD_MEMBERSHIP
+                resolved.leave = socket.IP_DROP_MEMBERSHIP
+        else:
+            if channel.ssm:
+                raise ValueError("Don't currently support ssm on ipv6")
+            name = channel.iface
+            if not name:
+                index = 0
+            elif isinstance(name, int):
+                index = name
+            else:
+                index = indices.get(name)
+                if index is None:
+                    index = indices[name] = mcastsocket.if_nametoindex(name)
+            resolved.iface = index
+            structure = group + struct.pack('@I', index)
+            resolved.level = socket.IPPROTO_IPV6
+            resolved.option = socket.IPV6_JOIN_GROUP
+            resolved.leave = socket.IPV6_LEAVE_GROUP
+        resolved.structure = structure
+        return resolved
+
+    def layout(self):
+        """Group resolved channels by (family, port)
+
+        returns {(family, port): [Resolved, ...]} in plan order
+        """
+        layout = collections.OrderedDict()
+        for resolved in self.resolved:
+            key = (resolved.family, resolved.channel.port)
+            layout.setdefault(key, []).append(resolved)
+        return layout
+
+    def open(self):
+        """Create sockets and apply every join, all-or-nothing
+
+        returns OpenPlan, on failure every socket created is closed (which
+        drops its memberships) and the error re-raised
+        """
+        opened = OpenPlan()
+        try:
+            for (family, port), members in self.layout().items():
+                sock = mcastsocket.create_socket(
+                    ('::' if family == socket.AF_INET6 else '', port),
+                    # resolve() ensured the channels agree on TTL
+                    TTL=members[0].channel.ttl, loop=self.loop,
+                    reuse=self.reuse, family=family,
+                    rcvbuf=self.rcvbuf, sndbuf=self.sndbuf,
+                )
+                opened.add(family, port, sock)
+                if sock.getsockname()[1] != port:
+                    # create_socket only logs bind failures
+                    raise socket.error(
+                        errno.EADDRINUSE, 'Unable to bind port', port,
+                    )
+                ifaces = set(member.iface for member in members)
+                if len(ifaces) == 1:
+                    iface = ifaces.pop()
+                    if family == socket.AF_INET6 and iface:
+                        sock.setsockopt(
+                            socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_IF,
+                            iface,
+                        )
+                    else:
+                        mcastsocket.limit_to_interface(sock, iface)
+                setsockopt = sock.setsockopt
+                for member in members:
+                    try:
+                        setsockopt(
+                            member.level, member.option, member.structure,
+                        )
+                    except (socket.error, IOError) as err:
+                        err.args += (member.channel,)
+                        raise
+                    opened.members.append((sock, member))
+        except Exception:
+            log.error('Failed opening channel plan, rolling back')
+            opened.close()
+            raise
+        log.info(
+            'Opened %s channels on %s sockets',
+            len(opened.members), len(opened.by_key),
+        )
+        return opened
+
+
+class OpenPlan(object):
+    """Sockets created by ChannelPlan.open"""
+
+    def __init__(self):
+        self.by_key = collections.OrderedDict()
+        self.members = []
+
+    def add(self, family, port, sock):
+        self.by_key[(family, port)] = sock
+
+    def sockets(self):
+        return list(self.by_key.values())
+
+    def socket_for(self, group, port):
+        """Retrieve the socket serving (group, port)"""
+        family, _ = family_of(group)
+        return self.by_key[(family, port)]
+
+    def close(self):
+        """Leave all groups and close every socket"""
+        for sock, member in reversed(self.members):
+            try:
+                sock.setsockopt(member.level, member.leave, member.structure)
+            except (socket.error, IOError):
+                pass
+        del self.members[:]
+        for sock in self.by_key.values():
+            sock.close()
+        self.by_key.clear()
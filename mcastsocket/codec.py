@@ -0,0 +1,219 @@
+"""Precompiled binary message headers for multicast payloads
+
+Declare a header schema once, the schema compiles it into a single cached
+struct.Struct (plus per-field offsets), then:
+
+* Encoder packs headers with pack_into straight into a reusable send buffer
+  and copies the payload in behind them, no per-message bytes concatenation
+* Decoder receives with recvfrom_into into a reusable receive buffer and
+  returns lazy Message views, fields are only unpacked when accessed
+
+.. code-block:: python
+
+    HEADER = codec.Schema([
+        ('version', 'B'),
+        ('flags', 'B'),
+        ('sequence', 'I'),
+        ('timestamp', 'd'),
+    ])
+    encoder = HEADER.encoder()
+    encoder.sendto(sock, (GROUP, PORT), payload, version=1, flags=0,
+                   sequence=seq, timestamp=time.time())
+
+    decoder = HEADER.decoder()
+    message, address = decoder.recvfrom(sock)
+    if message.sequence != expected:
+        ...
+    handle(message.payload)
+
+Messages (and their payload memoryviews) reference the decoder's buffer,
+they are only valid until the next recvfrom on that decoder, copy anything
+you need to keep (bytes(message.payload), message.values()).
+"""
+import struct
+
+UNALIGNED = ('!', '<', '>', '=')
+
+
+class Schema(object):
+    """Compiled header schema
+
+    * fields -- sequence of (name, struct format) pairs, each format must
+                describe exactly one value (e.g. 'I' or '16s', not '2H')
+    * byteorder -- struct byte order prefix, one of the unaligned orders
+                   '!', '<', '>' or '=' (default network order)
+    """
+
+    def __init__(self, fields, byteorder='!'):
+        self.fields = tuple(fields)
+        self.names = tuple(name for name, _ in self.fields)
+        if len(set(self.names)) != len(self.names):
+            raise ValueError('Duplicate field names in schema', self.names)
+        if byteorder not in UNALIGNED:
+            # native ('@') alignment would pad between fields and break the
+            # per-field offsets
+            raise ValueError(
+                'Byte order must be one of %s' % (', '.join(UNALIGNED),),
+                byteorder,
+            )
+        self.byteorder = byteorder
+        self.struct = struct.Struct(
+            byteorder + ''.join(format for _, format in self.fields)
+        )
+        self.size = self.struct.size
+        # name: (offset, single-field Struct), with the explicit byteorder
+        # there is no alignment padding so offsets are simple sums
+        self.offsets = {}
+        offset = 0
+        for name, format in self.fields:
+            field = struct.Struct(byteorder + format)
+            if len(field.unpack(b'\0' * field.size)) != 1:
+                raise ValueError(
+                    'Field format must describe a single value', name, format,
+                )
+            self.offsets[name] = (offset, field)
+            offset += field.size
+        self.message_class = _message_class(self)
+
+    def pack_into(self, buffer, values, payload=b'', offset=0):
+        """Pack header values and payload into buffer at offset
+
+        returns total length written
+        """
+        self.struct.pack_into(buffer, offset, *values)
+        start = offset + self.size
+        end = start + len(payload)
+        buffer[start:end] = payload
+        return end - offset
+
+    def ordered(self, fields):
+        """Convert keyword field values into positional order"""
+        if len(fields) != len(self.names):
+            unknown = sorted(set(fields) - set(self.names))
+            if unknown:
+                raise TypeError('Unknown header fields', unknown)
+        try:
+            return [fields[name] for name in self.names]
+        except KeyError as err:
+            raise TypeError('Missing header field', err.args[0])
+
+    def decode(self, data):
+        """Lazily decode data (bytes, bytearray or memoryview) as a Message"""
+        if len(data) < self.size:
+            raise ValueError(
+                'Message too short for header', len(data), self.size,
+            )
+        return self.message_class(memoryview(data))
+
+    def encoder(self, size=65536):
+        return Encoder(self, size)
+
+    def decoder(self, size=65536):
+        return Decoder(self, size)
+
+
+class Message(object):
+    """Lazy view of a received message, see Schema.decode"""
+    __slots__ = ('data', '_values')
+    schema = None
+
+    def __init__(self, data):
+        self.data = data
+        self._values = None
+
+    @property
+    def payload(self):
+        """memoryview of the data following the header"""
+        return self.data[self.schema.size:]
+
+    def values(self):
+        """Unpack (and cache) all header values in one call"""
+        if self._values is None:
+            self._values = self.schema.struct.unpack_from(self.data)
+        return self._values
+
+    def as_dict(self):
+        return dict(zip(self.schema.names, self.values()))
+
+    def __repr__(self):
+        return '%s(%r, payload=%d bytes)' % (
+            self.__class__.__name__, self.as_dict(), len(self.payload),
+        )
+
+
+def _field_property(name, index, offset, field):
+    def getter(message):
+        if message._values is not None:
+            return message._values[index]
+        return field.unpack_from(message.data, offset)[0]
+    getter.__name__ = name
+    return property(getter)
+
+
+def _message_class(schema):
+    """Create a Message subclass with a property per header field"""
+    namespace = {'__slots__': (), 'schema': schema}
+    for index, name in enumerate(schema.names):
+        if name.startswith('_') or name in (
+            'data', 'payload', 'values', 'as_dict', 'schema',
+        ):
+            raise ValueError('Reserved field name', name)
+        offset, field = schema.offsets[name]
+        namespace[name] = _field_property(name, index, offset, field)
+    return type(str('Message'), (Message,), namespace)
+
+
+class Encoder(object):
+    """Reusable send buffer for a schema
+
+    Not thread-safe, use an encoder per sending thread.
+    """
+
+    def __init__(self, schema, size=65536):
+        self.schema = schema
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+
+    def pack(self, values, payload=b''):
+        """Encode positional header values and payload
+
+        returns memoryview of the encoded message (valid until next pack)
+        """
+        if self.schema.size + len(payload) > len(self.buffer):
+            raise ValueError(
+                'Payload too large for send buffer',
+                len(payload), len(self.buffer),
+            )
+        length = self.schema.pack_into(self.buffer, values, payload)
+        return self.view[:length]
+
+    def encode(self, payload=b'', **fields):
+        """Encode keyword header values and payload, see pack"""
+        return self.pack(self.schema.ordered(fields), payload)
+
+    def sendto(self, sock, address, payload=b'', **fields):
+        """Encode and send to address on sock"""
+        return sock.sendto(
+            self.pack(self.schema.ordered(fields), payload), address
+        )
+
+
+class Decoder(object):
+    """Reusable receive buffer for a schema
+
+    Not thread-safe, use a decoder per receiving thread.
+    """
+
+    def __init__(self, schema, size=65536):
+        self.schema = schema
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+
+    def recvfrom(self, sock, flags=0):
+        """Receive one datagram from sock
+
+        returns (Message, address), message is only valid until the
+        next call
+        """
+        length, address = sock.recvfrom_into(self.buffer, 0, flags)
+        return self.schema.decode(self.view[:length]), address
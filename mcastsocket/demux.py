@@ -0,0 +1,187 @@
+"""Serve many multicast groups from a single socket
+
+Binding to (group,port) gives you one socket (and file descriptor, and
+wakeup) per group, binding to ('',port) loses which group a packet was sent
+to. This module enables IP_PKTINFO (IPV6_RECVPKTINFO for IPv6) so that the
+kernel reports the destination group and ingress interface index with each
+datagram, allowing one socket joined to many groups to dispatch to per-group
+handlers.
+
+.. code-block:: python
+
+    sock = mcastsocket.create_socket(('', 8000))
+    demux = demux.Demultiplexer(sock)
+    demux.join_group('224.1.1.2', on_quotes, iface='192.168.1.5')
+    demux.join_group('224.1.1.3', on_trades, iface='192.168.1.5')
+    while True:
+        select.select([sock], [], [])
+        demux.receive()
+
+Handlers are called as handler(data, address, group, ifindex).
+
+Requires socket.recvmsg (Python 3.3+).
+"""
+import collections
+import errno
+import logging
+import socket
+import struct
+from . import mcastsocket
+log = logging.getLogger(__name__)
+
+if not hasattr(socket, 'IP_PKTINFO'):
+    socket.IP_PKTINFO = 8
+if not hasattr(socket, 'IPV6_RECVPKTINFO'):
+    socket.IPV6_RECVPKTINFO = 49
+if not hasattr(socket, 'IPV6_PKTINFO'):
+    socket.IPV6_PKTINFO = 50
+
+# struct in_pktinfo {
+#     int ipi_ifindex; in_addr ipi_spec_dst; in_addr ipi_addr;
+# }
+IN_PKTINFO = struct.Struct('@i4s4s')
+# struct in6_pktinfo { in6_addr ipi6_addr; unsigned int ipi6_ifindex; }
+IN6_PKTINFO = struct.Struct('@16sI')
+
+
+def enable_pktinfo(sock):
+    """Ask the kernel to report destination address/interface on receive"""
+    if sock.family == socket.AF_INET6:
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_RECVPKTINFO, 1)
+    else:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_PKTINFO, 1)
+    return sock
+
+
+def ancillary_size(sock):
+    """Size of the ancillary buffer required for pktinfo on sock"""
+    if sock.family == socket.AF_INET6:
+        return socket.CMSG_SPACE(IN6_PKTINFO.size)
+    return socket.CMSG_SPACE(IN_PKTINFO.size)
+
+
+def parse_pktinfo(ancdata):
+    """Extract (packed destination address, ifindex) from recvmsg ancdata
+
+    The destination is left in packed (network) form so it can be used
+    as a lookup key without formatting, use socket.inet_ntop to display.
+
+    returns (None, None) if no pktinfo was present
+    """
+    for level, kind, data in ancdata:
+        if level == socket.IPPROTO_IP and kind == socket.IP_PKTINFO:
+            ifindex, _, destination = IN_PKTINFO.unpack_from(data)
+            return destination, ifindex
+        if level == socket.IPPROTO_IPV6 and kind == socket.IPV6_PKTINFO:
+            return IN6_PKTINFO.unpack_from(data)
+    return None, None
+
+
+def recv_pktinfo(sock, bufsize=65536):
+    """Receive one datagram with destination group and ingress interface
+
+    sock must have had enable_pktinfo() called on it
+
+    returns (data, address, group, ifindex) where group is the
+    canonical string form of the destination address
+    """
+    data, ancdata, _, address = sock.recvmsg(bufsize, ancillary_size(sock))
+    destination, ifindex = parse_pktinfo(ancdata)
+    if destination is not None:
+        destination = socket.inet_ntop(sock.family, destination)
+    return data, address, destination, ifindex
+
+
+class Demultiplexer(object):
+    """Dispatches datagrams from one socket to per-group handlers
+
+    * sock -- socket as from mcastsocket.create_socket, bound to ('',port)
+    * default -- handler for datagrams to groups without a handler,
+                 by default these are logged and dropped
+    * bufsize -- maximum datagram size to receive
+    """
+
+    def __init__(self, sock, default=None, bufsize=65536):
+        self.sock = enable_pktinfo(sock)
+        self.default = default
+        self.bufsize = bufsize
+        self.ancsize = ancillary_size(sock)
+        # packed destination address: (group, handler)
+        self.table = {}
+        # (group, iface, ssm): join count, handlers are only removed when
+        # the group is no longer joined on any interface
+        self.joins = collections.Counter()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def add_handler(self, group, handler):
+        """Register handler for datagrams sent to group"""
+        group = mcastsocket.canonical(self.sock, group)
+        key = socket.inet_pton(self.sock.family, group)
+        self.table[key] = (group, handler)
+        return group
+
+    def remove_handler(self, group):
+        group = mcastsocket.canonical(self.sock, group)
+        return self.table.pop(socket.inet_pton(self.sock.family, group), None)
+
+    def join_group(self, group, handler, iface='', ssm=None):
+        """Join group on our socket and dispatch its datagrams to handler"""
+        mcastsocket.join_group(self.sock, group, iface=iface, ssm=ssm)
+        group = self.add_handler(group, handler)
+        self.joins[(group, iface, ssm)] += 1
+        return group
+
+    def leave_group(self, group, iface='', ssm=None):
+        """Leave group on iface, its handler is kept while joined elsewhere"""
+        mcastsocket.leave_group(self.sock, group, iface=iface, ssm=ssm)
+        group = mcastsocket.canonical(self.sock, group)
+        key = (group, iface, ssm)
+        if self.joins[key] > 1:
+            self.joins[key] -= 1
+        else:
+            self.joins.pop(key, None)
+        if not any(joined[0] == group for joined in self.joins):
+            self.remove_handler(group)
+
+    def dispatch(self, data, address, destination, ifindex):
+        """Dispatch datagram given packed destination address"""
+        entry = self.table.get(destination)
+        if entry is not None:
+            group, handler = entry
+            return handler(data, address, group, ifindex)
+        if destination is not None:
+            group = socket.inet_ntop(self.sock.family, destination)
+        else:
+            group = None
+        if self.default is not None:
+            return self.default(data, address, group, ifindex)
+        log.debug('No handler for datagram to %s from %s', group, address)
+        return None
+
+    def receive(self, limit=64):
+        """Receive and dispatch up to limit pending datagrams
+
+        The socket is read without blocking until it is drained or limit
+        datagrams have been handled, so a single readiness notification
+        services a burst across all groups.
+
+        returns number of datagrams dispatched
+        """
+        recvmsg = self.sock.recvmsg
+        bufsize, ancsize = self.bufsize, self.ancsize
+        count = 0
+        while count < limit:
+            try:
+                data, ancdata, _, address = recvmsg(
+                    bufsize, ancsize, socket.MSG_DONTWAIT,
+                )
+            except socket.error as err:
+                if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            destination, ifindex = parse_pktinfo(ancdata)
+            self.dispatch(data, address, destination, ifindex)
+            count += 1
+        return count
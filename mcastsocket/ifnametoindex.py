@@ -6,7 +6,7 @@ the interface index, which is available in Python 3, but not
 in Python 2. This module is a small shim to provide the function
 missing.
 """
-import ctypes, ctypes.util, errno
+import ctypes, ctypes.util, errno, os
 try:
     unicode
 except NameError:
@@ -18,7 +18,8 @@ def get_libc():
     global LIBC
     if LIBC is None:
         LIBC = ctypes.CDLL(
-            ctypes.util.find_library('c')
+            ctypes.util.find_library('c'),
+            use_errno=True,
         )
     return LIBC
 
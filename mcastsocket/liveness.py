@@ -0,0 +1,226 @@
+"""Publisher liveness tracking for multicast consumers
+
+Tracks when each publisher (source address) on a group was last heard from
+and reports when publishers go silent or come back, scaling to thousands
+of publishers. Deadlines are kept in a hashed timing wheel, so recording a
+datagram and expiring publishers are both O(1) rather than a scan of every
+publisher on each tick.
+
+There is no thread, call observe() from your receive loop and poll() when
+your select/reactor timeout fires:
+
+.. code-block:: python
+
+    tracker = liveness.LivenessTracker(
+        timeout=.3,
+        on_down=lambda publisher: log.warning('Lost %s', publisher.source),
+        on_up=lambda publisher: log.info('Found %s', publisher.source),
+        sequence=lambda data: HEADER.decode(data).sequence,
+    )
+    while True:
+        readable, _, _ = select.select([sock], [], [], tracker.next_timeout())
+        if readable:
+            data, address = sock.recvfrom(65000)
+            tracker.observe(data, address)
+            ...
+        tracker.poll()
+"""
+import logging
+import math
+import time
+log = logging.getLogger(__name__)
+
+
+class TimerWheel(object):
+    """Hashed timing wheel of key: deadline
+
+    Deadlines are quantised to ticks, each slot holds the keys whose
+    deadline hashes to it. Rescheduling a key to a later deadline is lazy,
+    only the deadline is updated and the key is moved when its old slot
+    comes due, so frequently refreshed keys cost a dictionary store.
+
+    * tick -- resolution in seconds
+    * slots -- number of slots, ideally > timeout/tick so most keys fire
+               on their first visit
+    """
+
+    def __init__(self, tick=0.01, slots=512, now=None):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.deadlines = {}
+        self.current = self.ticks(time.time() if now is None else now)
+
+    def ticks(self, when):
+        return int(math.ceil(when / self.tick))
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def schedule(self, key, when):
+        """Set key's deadline to time when (seconds)"""
+        deadline = max(self.ticks(when), self.current + 1)
+        previous = self.deadlines.get(key)
+        self.deadlines[key] = deadline
+        if previous is None or deadline < previous:
+            # either not yet in a slot, or needs to fire earlier than the
+            # slot it is in, a stale entry in a later slot is ignored
+            self.slots[deadline % len(self.slots)].add(key)
+
+    def cancel(self, key):
+        """Remove key, stale slot entries are discarded when visited"""
+        return self.deadlines.pop(key, None) is not None
+
+    def advance(self, now=None):
+        """Advance to now, returning the list of keys which expired"""
+        target = self.ticks(time.time() if now is None else now)
+        if target <= self.current:
+            return []
+        expired = []
+        count = len(self.slots)
+        if target - self.current >= count:
+            # visited every slot, no need to go round more than once
+            ticks = range(target - count + 1, target + 1)
+        else:
+            ticks = range(self.current + 1, target + 1)
+        for tick in ticks:
+            slot = tick % count
+            keys = self.slots[slot]
+            if not keys:
+                continue
+            self.slots[slot] = set()
+            for key in keys:
+                deadline = self.deadlines.get(key)
+                if deadline is None:
+                    continue
+                if deadline <= target:
+                    del self.deadlines[key]
+                    expired.append(key)
+                else:
+                    # either further round(s) of the wheel to go, or was
+                    # lazily rescheduled and moves to its real slot
+                    self.slots[deadline % count].add(key)
+        self.current = target
+        return expired
+
+    def next_timeout(self, now=None):
+        """Seconds until the next tick boundary (for select timeouts)"""
+        if now is None:
+            now = time.time()
+        return max((self.current + 1) * self.tick - now, 0)
+
+
+class Publisher(object):
+    """Liveness state of a single publisher"""
+    __slots__ = (
+        'source', 'alive', 'first_seen', 'last_seen', 'received',
+        'lost', 'expected',
+    )
+
+    def __init__(self, source, now):
+        self.source = source
+        self.alive = False
+        self.first_seen = now
+        self.last_seen = now
+        self.received = 0
+        self.lost = 0
+        self.expected = None
+
+    def __repr__(self):
+        return '%s(%r, alive=%s, received=%s, lost=%s)' % (
+            self.__class__.__name__,
+            self.source, self.alive, self.received, self.lost,
+        )
+
+
+class LivenessTracker(object):
+    """Track publisher liveness from the receive path
+
+    * timeout -- seconds of silence before a publisher is considered down
+    * on_down -- callable(publisher) when a publisher goes silent
+    * on_up -- callable(publisher) when a publisher is first heard from,
+               or heard from again after going down
+    * sequence -- optional callable(data) returning the datagram's
+                  sequence number (or None), used to count per-publisher
+                  loss
+    * restart -- a sequence more than this far behind the expected one
+                 is taken as the publisher restarting, rather than a late
+                 (reordered or duplicate) datagram
+    * tick -- resolution of the deadline timer wheel
+    """
+
+    def __init__(
+        self, timeout=0.3, on_down=None, on_up=None, sequence=None,
+        restart=1000, tick=0.01, now=None,
+    ):
+        self.timeout = timeout
+        self.restart = restart
+        self.on_down = on_down
+        self.on_up = on_up
+        self.sequence = sequence
+        slots = max(int(math.ceil(timeout / tick)) * 2, 16)
+        self.wheel = TimerWheel(tick=tick, slots=slots, now=now)
+        self.publishers = {}
+
+    def observe(self, data, address, now=None):
+        """Record receipt of data from address (as from sock.recvfrom)"""
+        sequence = None
+        if self.sequence is not None:
+            try:
+                sequence = self.sequence(data)
+            except Exception as err:
+                log.debug(
+                    'Unable to extract sequence from %s: %s', address, err,
+                )
+        return self.seen(address[:2], now=now, sequence=sequence)
+
+    def seen(self, source, now=None, sequence=None):
+        """Record that source was heard from, returns the Publisher"""
+        if now is None:
+            now = time.time()
+        publisher = self.publishers.get(source)
+        if publisher is None:
+            publisher = self.publishers[source] = Publisher(source, now)
+        publisher.last_seen = now
+        publisher.received += 1
+        if sequence is not None:
+            expected = publisher.expected
+            if expected is not None and sequence > expected:
+                publisher.lost += sequence - expected
+            if (
+                expected is None or sequence >= expected or
+                expected - sequence > self.restart
+            ):
+                publisher.expected = sequence + 1
+        self.wheel.schedule(source, now + self.timeout)
+        if not publisher.alive:
+            publisher.alive = True
+            if self.on_up is not None:
+                self.on_up(publisher)
+        return publisher
+
+    def poll(self, now=None):
+        """Expire silent publishers, returns the Publishers that went down"""
+        down = []
+        for source in self.wheel.advance(now):
+            publisher = self.publishers[source]
+            publisher.alive = False
+            # restart loss accounting when it comes back
+            publisher.expected = None
+            down.append(publisher)
+            if self.on_down is not None:
+                self.on_down(publisher)
+        return down
+
+    def next_timeout(self, now=None):
+        return self.wheel.next_timeout(now)
+
+    def forget(self, source):
+        """Stop tracking source entirely"""
+        self.wheel.cancel(source)
+        return self.publishers.pop(source, None)
+
+    def alive(self):
+        return [p for p in self.publishers.values() if p.alive]
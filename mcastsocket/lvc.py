@@ -0,0 +1,283 @@
+"""Last-value cache for fast late-joiner startup
+
+A consumer that (re)starts and joins a group would otherwise have to wait
+for a full publish cycle before it knows the current value of every key.
+A CacheNode subscribes to the group and keeps the newest message per key
+(as given by a caller-supplied key extractor) in an LRU-bounded
+LastValueCache, and serves bulk snapshots over a local stream socket (a
+unix domain socket path, or a (host, port) TCP address).
+
+A late joiner should join the group *first*, buffering what it receives,
+then fetch the snapshot, apply it and then apply the buffered messages in
+order. Anything published while the snapshot was being fetched is in the
+buffer, so the consumer ends up current without missing updates.
+
+.. code-block:: python
+
+    # cache node
+    sock = mcastsocket.create_socket(('', PORT))
+    mcastsocket.join_group(sock, GROUP, iface='192.168.1.5')
+    node = lvc.CacheNode(
+        sock, lvc.LastValueCache(key=lambda data: bytes(data[:8])),
+        '/run/quotes-lvc.sock',
+    )
+    node.serve()
+
+    # late joiner (after joining and starting to buffer)
+    for message in lvc.fetch_snapshot('/run/quotes-lvc.sock'):
+        apply(message)
+"""
+import collections
+import errno
+import logging
+import os
+import select
+import socket
+import stat
+import struct
+import threading
+log = logging.getLogger(__name__)
+
+FRAME = struct.Struct('!I')
+
+
+class LastValueCache(object):
+    """Newest message per key, bounded by entry count and total bytes
+
+    * key -- callable(data) returning the (hashable) key of a message,
+             or None to ignore the message
+    * capacity -- maximum number of keys retained
+    * max_bytes -- optional maximum total size of retained messages
+
+    Least recently updated keys are evicted first.
+    """
+
+    def __init__(self, key, capacity=100000, max_bytes=None):
+        self.key = key
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.values = collections.OrderedDict()
+        self.bytes = 0
+        self.evicted = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def update(self, data):
+        """Store data as the newest value of its key, returns the key"""
+        key = self.key(data)
+        if key is None:
+            return None
+        if not isinstance(data, bytes):
+            # don't retain views onto re-used receive buffers
+            data = bytes(data)
+        with self.lock:
+            previous = self.values.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self.values[key] = data
+            self.bytes += len(data)
+            while len(self.values) > self.capacity or (
+                self.max_bytes is not None and
+                self.bytes > self.max_bytes and len(self.values) > 1
+            ):
+                _, evicted = self.values.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evicted += 1
+        return key
+
+    def snapshot(self):
+        """Point-in-time list of retained messages, oldest update first"""
+        with self.lock:
+            return list(self.values.values())
+
+
+def send_snapshot(connection, messages):
+    """Write length-prefixed messages and a terminating empty frame"""
+    try:
+        for message in messages:
+            connection.sendall(FRAME.pack(len(message)))
+            connection.sendall(message)
+        connection.sendall(FRAME.pack(0))
+    except socket.error as err:
+        log.warning('Failure sending snapshot: %s', err)
+    finally:
+        connection.close()
+
+
+def _stream_family(address):
+    if isinstance(address, (bytes, str)):
+        return socket.AF_UNIX
+    if ':' in address[0]:
+        return socket.AF_INET6
+    return socket.AF_INET
+
+
+def fetch_snapshot(address, timeout=5.0):
+    """Retrieve the snapshot from the CacheNode listening on address
+
+    returns list of messages (bytes), oldest update first
+    """
+    connection = socket.socket(_stream_family(address), socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    try:
+        connection.connect(address)
+        reader = connection.makefile('rb')
+        messages = []
+        while True:
+            header = reader.read(FRAME.size)
+            if len(header) < FRAME.size:
+                raise IOError('Snapshot truncated')
+            (length,) = FRAME.unpack(header)
+            if not length:
+                return messages
+            message = reader.read(length)
+            if len(message) < length:
+                raise IOError('Snapshot truncated')
+            messages.append(message)
+    finally:
+        connection.close()
+
+
+def _remove_stale(path):
+    """Unlink a unix socket path left behind by a node which has gone
+
+    raises socket.error (EADDRINUSE) if a node is still serving on path,
+    anything other than a socket is left for bind() to report
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except OSError as err:
+        if err.errno == errno.ENOENT:
+            return
+        raise
+    if not stat.S_ISSOCK(mode):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error as err:
+        if err.args[0] != errno.ECONNREFUSED:
+            raise
+        os.unlink(path)
+    else:
+        raise socket.error(
+            errno.EADDRINUSE, 'Cache node already serving', path,
+        )
+    finally:
+        probe.close()
+
+
+class CacheNode(object):
+    """Subscribe to a group, cache it, serve snapshots to late joiners
+
+    * sock -- multicast socket already joined to the group(s) to cache
+    * cache -- LastValueCache to maintain
+    * address -- local address to serve snapshots on, a unix socket path
+                 or (host, port) tuple
+    * send_timeout -- seconds a snapshot transfer may stall before the
+                      connection is dropped, so clients which stop reading
+                      do not hold a thread forever
+    * transfers -- maximum concurrent snapshot transfers, requests beyond
+                   this are closed without a snapshot
+    """
+
+    def __init__(
+        self, sock, cache, address, backlog=16, send_timeout=5.0,
+        transfers=8,
+    ):
+        self.sock = sock
+        self.cache = cache
+        self.address = address
+        self.send_timeout = send_timeout
+        self.transfers = threading.BoundedSemaphore(transfers)
+        self.buffer = bytearray(65536)
+        self.view = memoryview(self.buffer)
+        self.listener = socket.socket(
+            _stream_family(address), socket.SOCK_STREAM,
+        )
+        try:
+            if self.listener.family == socket.AF_UNIX:
+                _remove_stale(address)
+            else:
+                self.listener.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_REUSEADDR, 1,
+                )
+            self.listener.bind(address)
+            self.listener.listen(backlog)
+        except Exception:
+            self.listener.close()
+            raise
+        self.address = self.listener.getsockname()
+        self.snapshots = 0
+        self.rejected = 0
+        self.running = False
+
+    def sockets(self):
+        """Sockets to include in the caller's select loop"""
+        return [self.sock, self.listener]
+
+    def handle(self, readable):
+        """Handle readiness of any of our sockets()"""
+        if self.sock in readable:
+            length, _ = self.sock.recvfrom_into(self.buffer)
+            self.cache.update(self.view[:length])
+        if self.listener in readable:
+            self.serve_snapshot()
+
+    def serve_snapshot(self):
+        """Accept a request and stream a snapshot on a short-lived thread
+
+        The snapshot is a copy of the message references, taken here, so
+        the receive loop is only held up for that copy, not the transfer.
+        """
+        connection, _ = self.listener.accept()
+        if not self.transfers.acquire(False):
+            log.warning('Too many snapshot transfers, rejecting request')
+            self.rejected += 1
+            connection.close()
+            return None
+        connection.settimeout(self.send_timeout)
+        messages = self.cache.snapshot()
+        self.snapshots += 1
+        thread = threading.Thread(
+            target=self.transfer, args=(connection, messages),
+            name='mcastsocket-lvc-snapshot',
+        )
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def transfer(self, connection, messages):
+        try:
+            send_snapshot(connection, messages)
+        finally:
+            self.transfers.release()
+
+    def serve(self, timeout=0.5):
+        """Receive and serve until stop() is called"""
+        self.running = True
+        sockets = self.sockets()
+        while self.running:
+            readable, _, _ = select.select(sockets, [], [], timeout)
+            if readable:
+                self.handle(readable)
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        self.stop()
+        self.listener.close()
+        if isinstance(self.address, (bytes, str)):
+            try:
+                os.unlink(self.address)
+            except OSError:
+                pass
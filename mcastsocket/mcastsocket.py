@@ -56,6 +56,7 @@ To create a multicast socket:
 """
 import socket
 import logging
+import errno
 import struct
 log = logging.getLogger(__name__)
 try:
@@ -68,11 +69,17 @@ if not hasattr(socket, 'IP_ADD_SOURCE_MEMBERSHIP'):
     socket.IP_BLOCK_SOURCE = 38
     socket.IP_ADD_SOURCE_MEMBERSHIP = 39
     socket.IP_DROP_SOURCE_MEMBERSHIP = 40
+if not hasattr(socket, 'SO_RCVBUFFORCE'):
+    socket.SO_SNDBUFFORCE = 32
+    socket.SO_RCVBUFFORCE = 33
 if_nametoindex =  getattr(socket,'if_nametoindex',None)
 if if_nametoindex is None:
     from .ifnametoindex import if_nametoindex
 
-def create_socket(address, TTL=1, loop=True, reuse=True, family=socket.AF_INET):
+def create_socket(
+    address, TTL=1, loop=True, reuse=True, family=socket.AF_INET,
+    rcvbuf=None, sndbuf=None,
+):
     """Create our multicast socket for mDNS usage
 
     Creates a multicast UDP socket with ttl, loop and reuse parameters configured.
@@ -88,6 +95,8 @@ def create_socket(address, TTL=1, loop=True, reuse=True, family=socket.AF_INET):
     * TTL -- multicast TTL to set on the socket
     * loop -- whether to reflect our sent messages to our listening port
     * reuse -- whether to set up socket reuse parameters before binding
+    * rcvbuf, sndbuf -- if specified, requested socket buffer sizes in bytes,
+                        see set_buffer_sizes()
 
     Note: this no longer sets IP_MULTICAST_IF option, passing an iface parameter 
     to join_group() *will* specify the *sending* interface (for that group).
@@ -104,6 +113,8 @@ def create_socket(address, TTL=1, loop=True, reuse=True, family=socket.AF_INET):
         sock.setsockopt(socket.IPPROTO_IPV6,
                         socket.IPV6_MULTICAST_LOOP, int(bool(loop)))
     allow_reuse(sock, reuse)
+    if rcvbuf or sndbuf:
+        set_buffer_sizes(sock, rcvbuf=rcvbuf, sndbuf=sndbuf)
     try:
         # Note: multicast is *not* working if we don't bind on all interfaces, most likely
         # because the 224.* isn't getting mapped (routed) to the address of the interface...
@@ -201,6 +212,57 @@ def allow_reuse(sock, reuse=True):
         return True
     return False
 
+
+def set_buffer_size(sock, option, force_option, size):
+    """Set a single socket buffer size, see set_buffer_sizes"""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, force_option, size)
+    except (socket.error, IOError) as err:
+        if err.args[0] not in (errno.EPERM, errno.ENOPROTOOPT, errno.EINVAL):
+            raise
+        # unprivileged, the kernel silently caps this at net.core.*mem_max
+        sock.setsockopt(socket.SOL_SOCKET, option, size)
+    applied = sock.getsockopt(socket.SOL_SOCKET, option)
+    # linux reports double the value actually set (allowing for bookkeeping
+    # overhead), so half of it being less than we asked for means capped
+    if applied // 2 < size:
+        log.warning(
+            'Requested socket buffer of %s bytes, kernel applied %s',
+            size, applied,
+        )
+    return applied
+
+
+def set_buffer_sizes(sock, rcvbuf=None, sndbuf=None):
+    """Set receive and/or send buffer sizes on the socket
+
+    The default receive buffer is small enough that bursts of multicast
+    traffic can overflow it. SO_RCVBUFFORCE/SO_SNDBUFFORCE are used where
+    the process is privileged (CAP_NET_ADMIN), which bypasses the
+    net.core.rmem_max/wmem_max limits, otherwise falls back to
+    SO_RCVBUF/SO_SNDBUF.
+
+    returns (rcvbuf, sndbuf) as actually applied by the kernel
+    """
+    if rcvbuf:
+        set_buffer_size(
+            sock, socket.SO_RCVBUF, socket.SO_RCVBUFFORCE, rcvbuf,
+        )
+    if sndbuf:
+        set_buffer_size(
+            sock, socket.SO_SNDBUF, socket.SO_SNDBUFFORCE, sndbuf,
+        )
+    return get_buffer_sizes(sock)
+
+
+def get_buffer_sizes(sock):
+    """Retrieve (rcvbuf, sndbuf) sizes as applied by the kernel"""
+    return (
+        sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+        sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF),
+    )
+
+
 def group_struct(sock,group,iface):
     """Construct a base group structure and resolve iface
 
@@ -246,12 +308,12 @@ def join_group(sock, group, iface='', ssm=None):
             sock.setsockopt(
                 socket.IPPROTO_IP,
                 socket.IP_ADD_SOURCE_MEMBERSHIP,
-                struct
+                structure
             )
         else:
             sock.setsockopt(
                 socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
-                struct
+                structure
             )
 
 
@@ -0,0 +1,314 @@
+"""Multicast round-trip latency probe ("mping")
+
+A Responder listens on a probe group and echoes each probe back on a reply
+group, an Initiator sends timestamped probes at a configured rate and
+measures round-trip time from the echoes. As both timestamps come from the
+initiator's clock no clock synchronisation is required.
+
+Statistics are accumulated in fixed-size streaming histograms (plus
+RFC 3550 style jitter and sequence-gap loss), so a probe can run for hours
+without memory growth.
+
+.. code-block:: python
+
+    # responder host
+    sock = mcastsocket.create_socket(('', 8070))
+    mcastsocket.join_group(sock, '224.1.1.14', iface='192.168.1.5')
+    mping.Responder(sock, ('224.1.1.15', 8071)).serve()
+
+    # initiator host
+    sock = mcastsocket.create_socket(('', 8071))
+    mcastsocket.join_group(sock, '224.1.1.15', iface='192.168.1.6')
+    initiator = mping.Initiator(sock, ('224.1.1.14', 8070), rate=100)
+    initiator.run(duration=60)
+    for responder, stats in initiator.responders.items():
+        print(responder, stats.report())
+
+The ``mcastperf ping`` and ``mcastperf echo`` commands wrap these.
+"""
+import errno
+import logging
+import math
+import random
+import select
+import socket
+import time
+from . import codec
+log = logging.getLogger(__name__)
+
+MAGIC = 0x6d70696e
+PROBE = 1
+REPLY = 2
+HEADER = codec.Schema([
+    ('magic', 'I'),
+    ('kind', 'B'),
+    ('initiator', 'I'),
+    ('sequence', 'Q'),
+    ('timestamp', 'd'),
+])
+
+
+class Histogram(object):
+    """Fixed-memory log-bucketed histogram of positive values
+
+    Buckets grow geometrically by (1 + precision), so any reported
+    percentile is within precision (relative) of the true value, and the
+    bucket count depends only on the range, not the number of samples.
+
+    * minimum, maximum -- range of values tracked, values outside are
+                          clamped into the first/last bucket
+    * precision -- relative bucket width
+    """
+
+    def __init__(self, minimum=1e-6, maximum=60.0, precision=0.01):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.log_base = math.log(1.0 + precision)
+        self.counts = [0] * (self.index(maximum) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.low = None
+        self.high = None
+
+    def index(self, value):
+        if value <= self.minimum:
+            return 0
+        return int(math.log(value / self.minimum) / self.log_base) + 1
+
+    def value(self, index):
+        """Representative (upper bound) value for bucket index"""
+        if index == 0:
+            return self.minimum
+        return self.minimum * math.exp(index * self.log_base)
+
+    def add(self, value):
+        index = min(self.index(value), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if self.low is None or value < self.low:
+            self.low = value
+        if self.high is None or value > self.high:
+            self.high = value
+
+    def percentile(self, fraction):
+        """Approximate value at fraction (0-1) of the samples, or None"""
+        if not self.count:
+            return None
+        target = max(int(math.ceil(fraction * self.count)), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(max(self.value(index), self.low), self.high)
+        return self.high
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0.0
+        self.low = self.high = None
+
+
+class ProbeStats(object):
+    """Round-trip statistics for replies from one responder"""
+
+    def __init__(self, histogram=None):
+        self.histogram = histogram or Histogram()
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+        self.expected = None
+        self.jitter = 0.0
+        self.previous = None
+
+    def update(self, sequence, rtt):
+        self.received += 1
+        self.histogram.add(rtt)
+        if self.previous is not None:
+            # RFC 3550 interarrival jitter estimator
+            self.jitter += (abs(rtt - self.previous) - self.jitter) / 16.0
+        self.previous = rtt
+        if self.expected is None or sequence >= self.expected:
+            if self.expected is not None:
+                self.lost += sequence - self.expected
+            self.expected = sequence + 1
+        else:
+            # previously counted as lost (or a duplicate)
+            self.late += 1
+            self.lost = max(self.lost - 1, 0)
+
+    def report(self):
+        histogram = self.histogram
+        total = self.received + self.lost
+
+        def ms(value):
+            return '-' if value is None else '%.3fms' % (value * 1e3,)
+        return (
+            'received %d lost %d (%.2f%%) rtt min %s p50 %s p90 %s '
+            'p99 %s max %s jitter %s'
+        ) % (
+            self.received, self.lost,
+            100.0 * self.lost / total if total else 0.0,
+            ms(histogram.low),
+            ms(histogram.percentile(.5)),
+            ms(histogram.percentile(.9)),
+            ms(histogram.percentile(.99)),
+            ms(histogram.high),
+            ms(self.jitter),
+        )
+
+
+class Responder(object):
+    """Echo probes received on sock back to the reply address
+
+    * sock -- socket joined to the probe group
+    * reply -- (group, port) to which to send replies
+    * sender -- socket on which to send replies, default sock
+    """
+
+    def __init__(self, sock, reply, sender=None):
+        self.sock = sock
+        self.reply = reply
+        self.sender = sender or sock
+        self.buffer = bytearray(65536)
+        self.view = memoryview(self.buffer)
+        self.replies = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def handle(self):
+        """Receive and echo a single probe, returns True if echoed"""
+        length, address = self.sock.recvfrom_into(self.buffer)
+        try:
+            message = HEADER.decode(self.view[:length])
+        except ValueError:
+            return False
+        if message.magic != MAGIC or message.kind != PROBE:
+            return False
+        offset, field = HEADER.offsets['kind']
+        field.pack_into(self.buffer, offset, REPLY)
+        self.sender.sendto(self.view[:length], self.reply)
+        self.replies += 1
+        return True
+
+    def serve(self, duration=None):
+        """Echo probes until duration (forever if None) has elapsed"""
+        started = time.time()
+        while duration is None or time.time() - started < duration:
+            readable, _, _ = select.select([self.sock], [], [], .5)
+            if readable:
+                self.handle()
+
+
+class Initiator(object):
+    """Send timestamped probes and accumulate round-trip statistics
+
+    * sock -- socket joined to the reply group (probes are also sent on it)
+    * target -- (group, port) of the responder(s) probe group
+    * rate -- probes per second
+    * size -- datagram size (padded beyond the header)
+    """
+
+    def __init__(self, sock, target, rate=10.0, size=None):
+        if not rate or rate <= 0:
+            raise ValueError('Probe rate must be positive', rate)
+        self.sock = sock
+        self.target = target
+        self.rate = rate
+        self.identity = random.getrandbits(32)
+        self.encoder = HEADER.encoder()
+        self.decoder = HEADER.decoder()
+        self.padding = b'\0' * max((size or 0) - HEADER.size, 0)
+        self.sequence = 0
+        self.responders = {}
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, now=None):
+        if now is None:
+            now = time.time()
+        data = self.encoder.pack(
+            (MAGIC, PROBE, self.identity, self.sequence, now), self.padding,
+        )
+        try:
+            self.sock.sendto(data, self.target)
+        except socket.error as err:
+            log.warning('Failure sending probe: %s', err)
+        self.sequence += 1
+
+    def handle(self):
+        """Receive and account for a single reply, returns the rtt or None"""
+        try:
+            message, address = self.decoder.recvfrom(self.sock)
+        except ValueError:
+            return None
+        now = time.time()
+        if (
+            message.magic != MAGIC or message.kind != REPLY or
+            message.initiator != self.identity
+        ):
+            return None
+        rtt = now - message.timestamp
+        stats = self.responders.get(address[:2])
+        if stats is None:
+            stats = self.responders[address[:2]] = ProbeStats()
+            # every probe we sent should have been answered
+            stats.expected = 0
+        stats.update(message.sequence, rtt)
+        return rtt
+
+    def run(self, duration=None, count=None, interval=None, report=None):
+        """Probe until duration/count is reached
+
+        * interval, report -- if given, report(initiator) is called every
+                              interval seconds
+        """
+        started = time.time()
+        step = 1.0 / self.rate
+        last_report = started
+        while True:
+            now = time.time()
+            if duration is not None and now - started >= duration:
+                break
+            if count is not None and self.sequence >= count:
+                break
+            if interval and report and now - last_report >= interval:
+                report(self)
+                last_report = now
+            next_send = started + self.sequence * step
+            if now >= next_send:
+                self.send(now)
+                continue
+            try:
+                readable, _, _ = select.select(
+                    [self.sock], [], [], next_send - now,
+                )
+            except select.error as err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+            if readable:
+                self.handle()
+        # give the final probes a chance to come back
+        deadline = time.time() + min(1.0, 10 * step)
+        while time.time() < deadline:
+            readable, _, _ = select.select(
+                [self.sock], [], [], max(deadline - time.time(), 0),
+            )
+            if readable:
+                self.handle()
+        self.finish()
+
+    def finish(self):
+        """Count probes with no reply at all (from the tail) as lost"""
+        for stats in self.responders.values():
+            if stats.expected is not None and stats.expected < self.sequence:
+                stats.lost += self.sequence - stats.expected
+                stats.expected = self.sequence
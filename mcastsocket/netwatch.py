@@ -0,0 +1,472 @@
+"""Re-join multicast groups when interfaces or addresses change
+
+When an interface goes down (or its address is removed) the kernel silently
+drops the group memberships that were made on it, and they are *not* restored
+when the interface comes back. Rather than polling, the :class:`Watcher` here
+subscribes to rtnetlink link and address notifications and re-applies the
+affected joins (and :func:`mcastsocket.limit_to_interface` settings) as soon
+as the interface is usable again.
+
+.. code-block:: python
+
+    watcher = netwatch.Watcher()
+    sock = mcastsocket.create_socket(('', 8000))
+    watcher.join_group(sock, '224.1.1.2', iface='192.168.1.5')
+    while True:
+        readable, _, _ = select.select([sock, watcher], [], [])
+        if watcher in readable:
+            watcher.process()
+        ...
+
+or use :meth:`Watcher.start` to handle the events on a background thread.
+
+The event source is pluggable, anything with ``fileno()`` and ``read()``
+(returning a list of :class:`LinkEvent` instances) can be passed as
+``source``, which allows for testing without netlink or privileges.
+"""
+import collections
+import errno
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+from . import mcastsocket
+log = logging.getLogger(__name__)
+
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+IFLA_IFNAME = 3
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+
+IFF_UP = 0x1
+IFF_RUNNING = 0x40
+
+NLMSGHDR = struct.Struct('=IHHII')
+IFINFOMSG = struct.Struct('=BxHiII')
+IFADDRMSG = struct.Struct('=BBBBI')
+RTATTR = struct.Struct('=HH')
+
+LINK_UP = 'link-up'
+LINK_DOWN = 'link-down'
+ADDR_ADD = 'addr-add'
+ADDR_DEL = 'addr-del'
+
+LinkEvent = collections.namedtuple(
+    'LinkEvent', ('kind', 'index', 'name', 'address', 'timestamp'),
+)
+LogRecord = collections.namedtuple(
+    'LogRecord',
+    ('timestamp', 'event', 'action', 'target', 'latency', 'downtime', 'error'),
+)
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _attributes(data, offset, end):
+    """Iterate over (type,payload) rtattr pairs in data[offset:end]"""
+    while offset + RTATTR.size <= end:
+        length, kind = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        yield kind, data[offset + RTATTR.size:offset + length]
+        offset += _align(length)
+
+
+def parse_messages(data, timestamp=None):
+    """Parse a buffer of rtnetlink messages into a list of LinkEvent
+
+    Only link and address notifications are reported, everything else
+    is skipped.
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    events = []
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, kind, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        body = offset + NLMSGHDR.size
+        end = offset + length
+        if kind in (RTM_NEWLINK, RTM_DELLINK):
+            _, _, index, flags, _ = IFINFOMSG.unpack_from(data, body)
+            name = None
+            attributes = _attributes(data, body + IFINFOMSG.size, end)
+            for attr, payload in attributes:
+                if attr == IFLA_IFNAME:
+                    name = payload.rstrip(b'\0').decode('utf-8')
+            # also sent for attribute-only changes (mtu, promisc...), the
+            # Watcher only acts on actual up/down transitions
+            up = kind == RTM_NEWLINK and (
+                flags & IFF_UP and flags & IFF_RUNNING
+            )
+            events.append(LinkEvent(
+                LINK_UP if up else LINK_DOWN, index, name, None, timestamp,
+            ))
+        elif kind in (RTM_NEWADDR, RTM_DELADDR):
+            family, _, _, _, index = IFADDRMSG.unpack_from(data, body)
+            address = name = None
+            attributes = _attributes(data, body + IFADDRMSG.size, end)
+            for attr, payload in attributes:
+                if attr == IFA_LOCAL or (
+                    attr == IFA_ADDRESS and address is None
+                ):
+                    address = socket.inet_ntop(family, payload)
+                elif attr == IFA_LABEL:
+                    name = payload.rstrip(b'\0').decode('utf-8')
+            events.append(LinkEvent(
+                ADDR_ADD if kind == RTM_NEWADDR else ADDR_DEL,
+                index, name, address, timestamp,
+            ))
+        elif kind == NLMSG_DONE:
+            break
+        offset += _align(length)
+    return events
+
+
+def dump_addresses(family=socket.AF_UNSPEC):
+    """Retrieve the current addresses via an RTM_GETADDR dump
+
+    returns list of ADDR_ADD LinkEvent, one per configured address
+    """
+    sock = socket.socket(
+        socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE,
+    )
+    try:
+        sock.bind((0, 0))
+        body = IFADDRMSG.pack(family, 0, 0, 0, 0)
+        sock.send(NLMSGHDR.pack(
+            NLMSGHDR.size + len(body), RTM_GETADDR,
+            NLM_F_REQUEST | NLM_F_DUMP, 1, 0,
+        ) + body)
+        events = []
+        while True:
+            data = sock.recv(65536)
+            events.extend(parse_messages(data))
+            offset = 0
+            while offset + NLMSGHDR.size <= len(data):
+                length, kind, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+                if kind in (NLMSG_DONE, NLMSG_ERROR):
+                    return events
+                if length < NLMSGHDR.size:
+                    return events
+                offset += _align(length)
+    finally:
+        sock.close()
+
+
+def address_indices():
+    """Map of currently configured address: interface index
+
+    returns an empty map if rtnetlink is not available
+    """
+    try:
+        events = dump_addresses()
+    except (socket.error, AttributeError) as err:
+        log.warning('Unable to look up interface addresses: %s', err)
+        return {}
+    return dict((event.address, event.index) for event in events)
+
+
+class NetlinkSource(object):
+    """rtnetlink subscription to link and address change notifications"""
+    GROUPS = RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR
+
+    def __init__(self, groups=None):
+        self.sock = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE,
+        )
+        self.sock.bind((0, self.GROUPS if groups is None else groups))
+        self.sock.setblocking(False)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def read(self):
+        """Read all currently pending notifications (non-blocking)"""
+        events = []
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except socket.error as err:
+                if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                if err.args[0] == errno.ENOBUFS:
+                    # we overran the socket, the caller has lost events
+                    log.warning('Netlink notification buffer overrun')
+                    continue
+                raise
+            events.extend(parse_messages(data))
+        return events
+
+    def close(self):
+        self.sock.close()
+
+
+class Membership(object):
+    """Record of a join (or interface limit) to re-apply on changes
+
+    * index -- interface index of an IPv4 iface, link events carry only
+               the index, otherwise it is learned from address events
+    """
+
+    def __init__(self, sock, group, iface='', ssm=None, index=None):
+        self.sock = sock
+        self.group = group
+        self.iface = iface
+        self.ssm = ssm
+        self.index = index
+        self.down_since = None
+        if iface and sock.family == socket.AF_INET6:
+            self.index = mcastsocket.if_nametoindex(iface)
+
+    def matches(self, event):
+        """Does this event concern our interface?"""
+        if not self.iface:
+            # the kernel picks the interface via routing, any change may matter
+            return True
+        if self.sock.family == socket.AF_INET6:
+            if event.name is not None:
+                return event.name == self.iface
+            return event.index == self.index
+        if event.address is not None:
+            if event.address == self.iface:
+                self.index = event.index
+                return True
+            return False
+        return self.index is not None and event.index == self.index
+
+    def apply(self):
+        """Re-apply, returns False if the kernel still had the membership"""
+        if self.group is None:
+            mcastsocket.limit_to_interface(self.sock, self.iface)
+            return True
+        try:
+            mcastsocket.join_group(
+                self.sock, self.group, iface=self.iface, ssm=self.ssm,
+            )
+        except (socket.error, IOError) as err:
+            if err.args[0] == errno.EADDRINUSE:
+                # already joined, nothing was lost
+                return False
+            raise
+        return True
+
+    def __repr__(self):
+        return '%s(%r, iface=%r, ssm=%r)' % (
+            self.__class__.__name__, self.group, self.iface, self.ssm,
+        )
+
+
+class Watcher(object):
+    """Tracks memberships and re-applies them on link/address events
+
+    * source -- event source, defaults to a NetlinkSource
+    * history -- number of LogRecord entries retained in self.log
+    """
+    thread = None
+
+    def __init__(self, source=None, history=1024):
+        if source is None:
+            source = NetlinkSource()
+        self.source = source
+        self.memberships = []
+        # last seen state of (index,) links and (index, address) addresses
+        self.states = {}
+        # address: interface index, for IPv4 memberships
+        self.indices = {}
+        self.log = collections.deque(maxlen=history)
+        self.lock = threading.RLock()
+        self.running = False
+
+    def fileno(self):
+        return self.source.fileno()
+
+    def join_group(self, sock, group, iface='', ssm=None):
+        """Join as mcastsocket.join_group and re-join on interface changes"""
+        mcastsocket.join_group(sock, group, iface=iface, ssm=ssm)
+        membership = Membership(
+            sock, group, iface, ssm, index=self.interface_index(sock, iface),
+        )
+        with self.lock:
+            self.memberships.append(membership)
+        return membership
+
+    def leave_group(self, sock, group, iface='', ssm=None):
+        """Leave as mcastsocket.leave_group and stop tracking the membership"""
+        self.forget(sock, group, iface, ssm)
+        mcastsocket.leave_group(sock, group, iface=iface, ssm=ssm)
+
+    def limit_to_interface(self, sock, interface_ip):
+        """Limit as mcastsocket.limit_to_interface and re-apply on changes"""
+        if mcastsocket.limit_to_interface(sock, interface_ip):
+            membership = Membership(
+                sock, None, interface_ip,
+                index=self.interface_index(sock, interface_ip),
+            )
+            with self.lock:
+                self.memberships.append(membership)
+            return membership
+        return None
+
+    def interface_index(self, sock, iface):
+        """Index of the interface with IPv4 address iface (or None)
+
+        Addresses are dumped once and then kept up to date from address
+        events, rather than dumping on every join.
+        """
+        if not iface or sock.family == socket.AF_INET6:
+            return None
+        address = mcastsocket.canonical(sock, iface)
+        with self.lock:
+            if address not in self.indices:
+                self.indices.update(address_indices())
+            return self.indices.get(address)
+
+    def forget(self, sock, group=None, iface='', ssm=None):
+        """Stop tracking memberships for sock (and group, if given)"""
+        key = (group, iface, ssm)
+        with self.lock:
+            self.memberships = [
+                m for m in self.memberships
+                if not (
+                    m.sock is sock and (
+                        group is None or (m.group, m.iface, m.ssm) == key
+                    )
+                )
+            ]
+
+    def process(self, events=None):
+        """Handle pending events (reading them from source if not given)
+
+        returns list of LogRecord for the actions taken
+        """
+        if events is None:
+            events = self.source.read()
+        records = []
+        for event in events:
+            records.extend(self.handle(event))
+        return records
+
+    def transition(self, event):
+        """Record the state the event reports, returns True if it changed
+
+        Unknown (never seen) interfaces count as changed, re-applying a
+        membership which is still in place is harmless.
+        """
+        up = event.kind in (LINK_UP, ADDR_ADD)
+        if event.kind in (LINK_UP, LINK_DOWN):
+            key = (event.index,)
+        else:
+            key = (event.index, event.address)
+            if up and event.address is not None:
+                self.indices[event.address] = event.index
+        previous = self.states.get(key)
+        self.states[key] = up
+        return previous != up
+
+    def handle(self, event):
+        """Handle a single LinkEvent, re-joining affected memberships"""
+        records = []
+        with self.lock:
+            if not self.transition(event):
+                return records
+            lost = event.kind in (LINK_DOWN, ADDR_DEL)
+            memberships = [m for m in self.memberships if m.matches(event)]
+            for membership in memberships:
+                if lost:
+                    if not membership.iface:
+                        # the kernel routed the join, we cannot tell if it
+                        # was on this interface, re-applied on any up event
+                        continue
+                    if membership.down_since is None:
+                        membership.down_since = event.timestamp
+                    records.append(self.record(event, 'lost', membership))
+                    continue
+                try:
+                    rejoined = membership.apply()
+                except (socket.error, IOError) as err:
+                    log.warning('Unable to re-apply %r: %s', membership, err)
+                    records.append(
+                        self.record(event, 'failed', membership, err),
+                    )
+                    continue
+                if rejoined:
+                    records.append(self.record(event, 'rejoined', membership))
+                elif membership.down_since is not None:
+                    # the kernel kept the membership through the outage
+                    records.append(self.record(event, 'intact', membership))
+                membership.down_since = None
+        return records
+
+    def record(self, event, action, membership, error=None):
+        """Log an action, latency is from event receipt to completion
+
+        downtime is the time since the interface was seen going away
+        (if it was seen going away), the effective gap in reception.
+        """
+        now = time.time()
+        downtime = None
+        if action == 'rejoined' and membership.down_since is not None:
+            downtime = now - membership.down_since
+        record = LogRecord(
+            now, event, action, membership,
+            now - event.timestamp, downtime, error,
+        )
+        if action == 'rejoined':
+            log.info(
+                'Re-applied %r after %s in %.6fs',
+                membership, event.kind, record.latency,
+            )
+        self.log.append(record)
+        return record
+
+    def run(self, timeout=1.0):
+        """Block processing events until stop() is called"""
+        self.running = True
+        while self.running:
+            try:
+                readable, _, _ = select.select([self.source], [], [], timeout)
+            except (select.error, ValueError):
+                if not self.running:
+                    break
+                raise
+            if readable:
+                self.process()
+
+    def start(self):
+        """Process events on a daemon thread"""
+        self.thread = threading.Thread(
+            target=self.run, name='mcastsocket-netwatch',
+        )
+        self.thread.daemon = True
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        self.source.close()
@@ -0,0 +1,364 @@
+"""iperf-style multicast load generator and receiver
+
+Installed as the ``mcastperf`` console script:
+
+.. code-block:: bash
+
+    # on the receiving host(s)
+    $ mcastperf recv 224.1.1.2 8053 --iface 192.168.1.5
+    # on the sending host
+    $ mcastperf send 224.1.1.2 8053 --iface 192.168.1.6 \
+        --rate 50000 --size 1200
+
+The sender paces fixed-size datagrams at the target packet rate, each
+carrying a sender id, sequence number and send timestamp. The receiver
+reports achieved packets/second, bandwidth, loss, reordering and one-way
+latency percentiles at each interval. Latency is only meaningful where
+sender and receiver clocks are synchronised (or on the same host).
+
+The ``ping`` and ``echo`` commands measure round-trip latency, loss and
+jitter instead (see mcastsocket.mping):
+
+.. code-block:: bash
+
+    $ mcastperf echo 224.1.1.14 8070 --reply-group 224.1.1.15 \
+        --iface 192.168.1.5
+    $ mcastperf ping 224.1.1.14 8070 --reply-group 224.1.1.15 \
+        --iface 192.168.1.6
+"""
+from __future__ import print_function
+import argparse
+import logging
+import os
+import random
+import select
+import socket
+import sys
+import time
+from . import mcastsocket, codec, mping
+log = logging.getLogger(__name__)
+
+MAGIC = 0x6d706572
+HEADER = codec.Schema([
+    ('magic', 'I'),
+    ('sender', 'I'),
+    ('sequence', 'Q'),
+    ('timestamp', 'd'),
+])
+
+
+def family_for(group):
+    return socket.AF_INET6 if ':' in group else socket.AF_INET
+
+
+def open_socket(options, bind_port, group=None):
+    """Create and join a socket as described by command-line options"""
+    group = group or options.group
+    family = family_for(group)
+    bind = '::' if family == socket.AF_INET6 else ''
+    sock = mcastsocket.create_socket(
+        (bind, bind_port), TTL=options.ttl, loop=options.loop, family=family,
+    )
+    mcastsocket.join_group(
+        sock, group, iface=options.iface or '', ssm=options.ssm,
+    )
+    return sock
+
+
+def format_latency(value):
+    if value is None:
+        return '-'
+    if abs(value) < 1e-3:
+        return '%.0fus' % (value * 1e6,)
+    return '%.2fms' % (value * 1e3,)
+
+
+class SendStats(object):
+    """Counters for a sending interval"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.packets = 0
+        self.bytes = 0
+        self.errors = 0
+
+    def report(self, now, total_elapsed):
+        elapsed = max(now - self.started, 1e-9)
+        return '[%7.2fs] sent %8.0f pps %9.3f Mbps errors %d' % (
+            total_elapsed,
+            self.packets / elapsed,
+            self.bytes * 8 / elapsed / 1e6,
+            self.errors,
+        )
+
+
+class ReceiveStats(object):
+    """Counters for a receiving interval, sequence state persists per sender"""
+
+    def __init__(self, expected=None):
+        # sender: next expected sequence
+        self.expected = {} if expected is None else expected
+        # fixed memory however high the packet rate
+        self.latencies = mping.Histogram()
+        self.reset()
+
+    def reset(self, now=None):
+        self.started = now or time.time()
+        self.packets = 0
+        self.bytes = 0
+        self.lost = 0
+        self.reordered = 0
+        self.latencies.reset()
+
+    def update(self, message, length, now):
+        """Account for a received message (a HEADER Message)"""
+        if message.magic != MAGIC:
+            return False
+        sender, sequence = message.sender, message.sequence
+        self.packets += 1
+        self.bytes += length
+        self.latencies.add(now - message.timestamp)
+        expected = self.expected.get(sender)
+        if expected is None or sequence == expected:
+            self.expected[sender] = sequence + 1
+        elif sequence > expected:
+            self.lost += sequence - expected
+            self.expected[sender] = sequence + 1
+        else:
+            # late arrival, previously counted as lost
+            self.reordered += 1
+            self.lost -= 1
+        return True
+
+    def report(self, now, total_elapsed):
+        elapsed = max(now - self.started, 1e-9)
+        latencies = self.latencies
+        # late arrivals from a previous interval can make lost negative
+        lost = max(self.lost, 0)
+        total = self.packets + lost
+        return (
+            '[%7.2fs] recv %8.0f pps %9.3f Mbps lost %d (%.3f%%) '
+            'reordered %d latency p50 %s p90 %s p99 %s max %s'
+        ) % (
+            total_elapsed,
+            self.packets / elapsed,
+            self.bytes * 8 / elapsed / 1e6,
+            lost,
+            100.0 * lost / total if total else 0.0,
+            self.reordered,
+            format_latency(latencies.percentile(.5)),
+            format_latency(latencies.percentile(.9)),
+            format_latency(latencies.percentile(.99)),
+            format_latency(latencies.high),
+        )
+
+
+def send(options, output=sys.stdout):
+    """Send paced test traffic until duration/count is reached"""
+    sock = open_socket(options, 0)
+    target = (options.group, options.port)
+    encoder = HEADER.encoder()
+    payload = os.urandom(max(options.size - HEADER.size, 0))
+    sender = random.getrandbits(32)
+    interval = 1.0 / options.rate if options.rate else 0
+    started = time.time()
+    stats = SendStats()
+    sequence = 0
+    try:
+        while True:
+            now = time.time()
+            if options.duration and now - started >= options.duration:
+                break
+            if options.count and sequence >= options.count:
+                break
+            if now - stats.started >= options.interval:
+                print(stats.report(now, now - started), file=output)
+                stats = SendStats()
+            if interval:
+                delay = started + sequence * interval - now
+                if delay > 0:
+                    time.sleep(min(delay, options.interval))
+                    continue
+            data = encoder.pack((MAGIC, sender, sequence, now), payload)
+            try:
+                sock.sendto(data, target)
+            except socket.error as err:
+                log.debug('Send failure: %s', err)
+                stats.errors += 1
+            else:
+                stats.packets += 1
+                stats.bytes += len(data)
+            sequence += 1
+        now = time.time()
+        print(stats.report(now, now - started), file=output)
+    finally:
+        mcastsocket.leave_group(
+            sock, options.group, iface=options.iface or '', ssm=options.ssm,
+        )
+        sock.close()
+    return sequence
+
+
+def recv(options, output=sys.stdout):
+    """Receive test traffic, reporting at each interval"""
+    sock = open_socket(options, options.port)
+    decoder = HEADER.decoder()
+    started = time.time()
+    stats = ReceiveStats()
+    received = 0
+    try:
+        while True:
+            now = time.time()
+            if options.duration and now - started >= options.duration:
+                break
+            if options.count and received >= options.count:
+                break
+            if now - stats.started >= options.interval:
+                print(stats.report(now, now - started), file=output)
+                stats.reset(now)
+            readable, _, _ = select.select(
+                [sock], [], [], max(stats.started + options.interval - now, 0),
+            )
+            if not readable:
+                continue
+            try:
+                message, _ = decoder.recvfrom(sock)
+            except ValueError:
+                # too short to be one of ours
+                continue
+            if stats.update(message, len(message.data), time.time()):
+                received += 1
+        now = time.time()
+        print(stats.report(now, now - started), file=output)
+    finally:
+        mcastsocket.leave_group(
+            sock, options.group, iface=options.iface or '', ssm=options.ssm,
+        )
+        sock.close()
+    return received
+
+
+def ping(options, output=sys.stdout):
+    """Send round-trip probes to echo responders, reporting each interval"""
+    sock = open_socket(options, options.reply_port, options.reply_group)
+    initiator = mping.Initiator(
+        sock, (options.group, options.port),
+        rate=options.rate, size=options.size,
+    )
+    started = time.time()
+
+    def report(initiator):
+        elapsed = time.time() - started
+        if not initiator.responders:
+            print('[%7.2fs] sent %d no replies' % (
+                elapsed, initiator.sequence,
+            ), file=output)
+        for responder, stats in sorted(initiator.responders.items()):
+            print('[%7.2fs] %s sent %d %s' % (
+                elapsed, responder[0], initiator.sequence, stats.report(),
+            ), file=output)
+    try:
+        initiator.run(
+            duration=options.duration or None, count=options.count or None,
+            interval=options.interval, report=report,
+        )
+    except KeyboardInterrupt:
+        initiator.finish()
+    finally:
+        report(initiator)
+        mcastsocket.leave_group(
+            sock, options.reply_group, iface=options.iface or '',
+            ssm=options.ssm,
+        )
+        sock.close()
+    return initiator
+
+
+def echo(options, output=sys.stdout):
+    """Echo round-trip probes back to the reply group"""
+    sock = open_socket(options, options.port)
+    responder = mping.Responder(
+        sock, (options.reply_group, options.reply_port),
+    )
+    try:
+        responder.serve(duration=options.duration or None)
+    finally:
+        print('echoed %d probes' % (responder.replies,), file=output)
+        mcastsocket.leave_group(
+            sock, options.group, iface=options.iface or '', ssm=options.ssm,
+        )
+        sock.close()
+    return responder
+
+
+def get_options():
+    parser = argparse.ArgumentParser(
+        description='Multicast load generator and receiver',
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    for name, function in (
+        ('send', send), ('recv', recv), ('ping', ping), ('echo', echo),
+    ):
+        sub = subparsers.add_parser(name, help=function.__doc__)
+        sub.set_defaults(function=function)
+        sub.add_argument('group', help='Multicast group to use')
+        sub.add_argument('port', type=int, help='UDP port to use')
+        sub.add_argument(
+            '--iface', default='',
+            help='Interface IP (IPv4) or name (IPv6) to use',
+        )
+        sub.add_argument('--ssm', help='Source for source-specific multicast')
+        sub.add_argument('--ttl', type=int, default=1, help='Multicast TTL')
+        sub.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds between reports',
+        )
+        sub.add_argument(
+            '--duration', type=float, default=0,
+            help='Seconds to run, 0 to run until interrupted',
+        )
+        sub.add_argument(
+            '--count', type=int, default=0,
+            help='Datagrams to send/receive, 0 for no limit',
+        )
+        sub.add_argument(
+            '--loop', action='store_true', default=False,
+            help='Enable multicast loopback (to test on a single host)',
+        )
+        if name in ('send', 'ping'):
+            minimum = (HEADER if name == 'send' else mping.HEADER).size
+            sub.add_argument(
+                '--size', type=int, default=minimum,
+                help='Datagram payload size in bytes (min %d)' % (minimum,),
+            )
+            sub.add_argument(
+                '--rate', type=float, default=1000 if name == 'send' else 10,
+                help='Target packets per second, 0 for unlimited',
+            )
+        if name in ('ping', 'echo'):
+            sub.add_argument(
+                '--reply-group', required=True,
+                help='Group on which the responder echoes probes',
+            )
+            sub.add_argument(
+                '--reply-port', type=int,
+                help='Port on which the responder echoes (default port+1)',
+            )
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.WARNING)
+    options = get_options().parse_args(argv)
+    if getattr(options, 'reply_group', None) and not options.reply_port:
+        options.reply_port = options.port + 1
+    try:
+        options.function(options)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""Batched multicast publishing for multi-threaded producers
+
+Rather than having every producer thread call sendto on a shared socket
+(one syscall per message, with threads contending for the socket),
+producers enqueue into a Publisher and a dedicated sender thread drains the
+queue in batches, using sendmmsg(2) where the C library provides it (one
+syscall per batch) and falling back to sendto otherwise.
+
+.. code-block:: python
+
+    sock = mcastsocket.create_socket(('', 0), TTL=5)
+    mcastsocket.limit_to_interface(sock, '192.168.1.5')
+    publisher = publisher.Publisher(sock, (GROUP, PORT), capacity=8192)
+    # from any number of threads
+    publisher.publish(payload)
+    ...
+    publisher.close()
+
+Messages are sent in the order they were enqueued, so order is preserved
+for each producer thread.
+"""
+import collections
+import ctypes
+import errno
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+from .ifnametoindex import get_libc
+log = logging.getLogger(__name__)
+
+BLOCK = 'block'
+DROP = 'drop'
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(iovec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', msghdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+
+def get_sendmmsg():
+    """Retrieve the C library's sendmmsg function, or None if unavailable"""
+    try:
+        function = get_libc().sendmmsg
+    except (AttributeError, OSError, TypeError):
+        return None
+    function.argtypes = [
+        ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int,
+    ]
+    function.restype = ctypes.c_int
+    return function
+
+
+def pack_sockaddr(family, address):
+    """Pack a python socket address as a C struct sockaddr_in/sockaddr_in6"""
+    if family == socket.AF_INET6:
+        host, port = address[:2]
+        flowinfo = address[2] if len(address) > 2 else 0
+        scope_id = address[3] if len(address) > 3 else 0
+        return struct.pack(
+            '=H', family
+        ) + struct.pack(
+            '!HI', port, flowinfo
+        ) + socket.inet_pton(family, host) + struct.pack('=I', scope_id)
+    host, port = address
+    return struct.pack('=H', family) + struct.pack('!H', port) + \
+        socket.inet_pton(family, host) + b'\0' * 8
+
+
+# failures attributable to a single message (rather than the socket)
+MESSAGE_ERRORS = (socket.error, struct.error, TypeError, ValueError)
+
+
+class ProducerStats(object):
+    """Per-producer-thread counters"""
+    __slots__ = ('name', 'published', 'dropped', 'blocked')
+
+    def __init__(self, name):
+        self.name = name
+        self.published = 0
+        self.dropped = 0
+        self.blocked = 0
+
+    def __repr__(self):
+        return '%s(%r, published=%s, dropped=%s, blocked=%s)' % (
+            self.__class__.__name__,
+            self.name, self.published, self.dropped, self.blocked,
+        )
+
+
+class Publisher(object):
+    """Queue messages from many threads, send them in batches from one
+
+    * sock -- socket as from mcastsocket.create_socket
+    * address -- default (group,port) destination
+    * capacity -- maximum number of queued (and in-flight) messages
+    * overflow -- BLOCK to make producers wait for space, DROP to discard
+    * batch -- maximum messages per send syscall
+    * timeout -- default seconds a BLOCK producer waits before dropping,
+                 None to wait forever
+    * use_sendmmsg -- set False to force the sendto fallback
+    """
+
+    def __init__(
+        self, sock, address=None, capacity=65536, overflow=BLOCK,
+        batch=64, timeout=None, use_sendmmsg=True,
+    ):
+        if overflow not in (BLOCK, DROP):
+            raise ValueError('Unknown overflow policy', overflow)
+        self.sock = sock
+        self.address = address
+        self.capacity = capacity
+        self.overflow = overflow
+        self.batch = batch
+        self.timeout = timeout
+        self.queue = collections.deque()
+        # one short-held lock guards the queue and the closed flag, so a
+        # message is either enqueued before close() or rejected
+        self.lock = threading.Lock()
+        self.space = threading.Condition(self.lock)
+        self.done = threading.Condition(self.lock)
+        self.pending = threading.Event()
+        self.local = threading.local()
+        # thread idents are re-used, so this is just a list of stats
+        self.producers = []
+        self.producers_lock = threading.Lock()
+        self.enqueued = 0
+        self.completed = 0
+        self.sent = 0
+        self.errors = 0
+        self.batches = 0
+        self.closed = False
+        self.sockaddrs = {}
+        self.sendmmsg = get_sendmmsg() if use_sendmmsg else None
+        if self.sendmmsg is not None:
+            self.headers = (mmsghdr * batch)()
+            self.iovecs = (iovec * batch)()
+            for header, vector in zip(self.headers, self.iovecs):
+                header.msg_hdr.msg_iov = ctypes.pointer(vector)
+                header.msg_hdr.msg_iovlen = 1
+        self.thread = threading.Thread(
+            target=self.run, name='mcastsocket-publisher',
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stats(self):
+        """Retrieve (creating) the ProducerStats for the calling thread"""
+        try:
+            return self.local.stats
+        except AttributeError:
+            thread = threading.current_thread()
+            stats = self.local.stats = ProducerStats(thread.name)
+            with self.producers_lock:
+                self.producers.append(stats)
+            return stats
+
+    def publish(self, payload, address=None, timeout=None):
+        """Enqueue payload for sending to address (default self.address)
+
+        returns True if queued, False if dropped due to overflow
+        """
+        address = address or self.address
+        if address is None:
+            raise ValueError('No address given and no default address')
+        stats = self.stats()
+        if not isinstance(payload, bytes):
+            # producers may re-use their buffers once we return
+            payload = bytes(payload)
+        queue = self.queue
+        with self.lock:
+            if self.closed:
+                raise RuntimeError('Publisher is closed')
+            if self.enqueued - self.completed >= self.capacity:
+                if self.overflow == DROP:
+                    stats.dropped += 1
+                    return False
+                stats.blocked += 1
+                if timeout is None:
+                    timeout = self.timeout
+                deadline = None if timeout is None else time.time() + timeout
+                while (
+                    self.enqueued - self.completed >= self.capacity and
+                    not self.closed
+                ):
+                    if deadline is None:
+                        self.space.wait()
+                    else:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            stats.dropped += 1
+                            return False
+                        self.space.wait(remaining)
+                if self.closed:
+                    raise RuntimeError('Publisher is closed')
+            queue.append((payload, address))
+            self.enqueued += 1
+        stats.published += 1
+        self.pending.set()
+        return True
+
+    def flush(self, timeout=None):
+        """Wait until everything enqueued so far has been sent
+
+        returns True if flushed, False on timeout
+        """
+        with self.done:
+            target = self.enqueued
+            if self.completed >= target:
+                return True
+            self.pending.set()
+            deadline = None if timeout is None else time.time() + timeout
+            while self.completed < target:
+                if deadline is None:
+                    self.done.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self.done.wait(remaining)
+            return True
+
+    def close(self, timeout=None):
+        """Stop accepting messages, flush the queue and stop the sender
+
+        The socket is *not* closed, it belongs to the caller.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.space.notify_all()
+        self.flush(timeout)
+        self.pending.set()
+        self.thread.join(timeout)
+
+    def run(self):
+        queue = self.queue
+        while True:
+            self.pending.wait()
+            self.pending.clear()
+            while True:
+                with self.lock:
+                    messages = [
+                        queue.popleft()
+                        for _ in range(min(self.batch, len(queue)))
+                    ]
+                    if not messages:
+                        if self.closed:
+                            # nothing can be enqueued once closed is set
+                            return
+                        break
+                accounted = self.sent + self.errors
+                try:
+                    self.send(messages)
+                except Exception:
+                    log.exception('Failure sending batch of %s', len(messages))
+                    # send() counted those it got to
+                    accounted = self.sent + self.errors - accounted
+                    self.errors += len(messages) - accounted
+                with self.lock:
+                    self.completed += len(messages)
+                    self.batches += 1
+                    self.done.notify_all()
+                    self.space.notify_all()
+
+    def send(self, messages):
+        """Send the batch of (payload, address) messages"""
+        if self.sendmmsg is None:
+            for payload, address in messages:
+                try:
+                    self.sock.sendto(payload, address)
+                    self.sent += 1
+                except MESSAGE_ERRORS as err:
+                    log.warning('Failure sending to %s: %s', address, err)
+                    self.errors += 1
+            return
+        valid = []
+        for message in messages:
+            try:
+                self.sockaddr(message[1])
+            except MESSAGE_ERRORS as err:
+                log.warning('Invalid address %r: %s', message[1], err)
+                self.errors += 1
+            else:
+                valid.append(message)
+        messages = valid
+        offset = 0
+        while offset < len(messages):
+            count = self.send_mmsg(messages[offset:])
+            if count < 0:
+                error = ctypes.get_errno()
+                if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    select.select([], [self.sock], [], 1.0)
+                    continue
+                log.warning(
+                    'Failure sending to %s: %s',
+                    messages[offset][1], errno.errorcode.get(error, error),
+                )
+                # skip the failing message, continue with the rest
+                self.errors += 1
+                offset += 1
+                continue
+            self.sent += count
+            offset += count
+
+    def sockaddr(self, address):
+        """Cached (buffer, length) C sockaddr for address"""
+        cached = self.sockaddrs.get(address)
+        if cached is None:
+            packed = pack_sockaddr(self.sock.family, address)
+            cached = self.sockaddrs[address] = (
+                ctypes.create_string_buffer(packed, len(packed)),
+                len(packed),
+            )
+        return cached
+
+    def send_mmsg(self, messages):
+        keep = []
+        for index, (payload, address) in enumerate(messages):
+            cached = self.sockaddr(address)
+            header = self.headers[index].msg_hdr
+            header.msg_name = ctypes.addressof(cached[0])
+            header.msg_namelen = cached[1]
+            data = ctypes.c_char_p(payload)
+            keep.append(data)
+            self.iovecs[index].iov_base = ctypes.cast(data, ctypes.c_void_p)
+            self.iovecs[index].iov_len = len(payload)
+        return self.sendmmsg(
+            self.sock.fileno(), self.headers, len(messages), 0,
+        )
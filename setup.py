@@ -36,6 +36,11 @@ setup(
     package_dir={'mcastsocket':
                  'mcastsocket'},
     include_package_data=True,
+    entry_points={
+        'console_scripts': [
+            'mcastperf=mcastsocket.perf:main',
+        ],
+    },
     install_requires=requirements,
     license="LGPL",
     zip_safe=False,
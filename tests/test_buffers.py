@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_buffers
+----------------------------------
+
+Tests for `mcastsocket.buffers` module and buffer sizing.
+"""
+import select
+import unittest
+from mcastsocket import mcastsocket, buffers
+
+
+class TestBuffers(unittest.TestCase):
+
+    def test_create_socket_sizes(self):
+        sock = mcastsocket.create_socket(
+            ('', 8060), rcvbuf=128 * 1024, sndbuf=64 * 1024,
+        )
+        try:
+            rcvbuf, sndbuf = mcastsocket.get_buffer_sizes(sock)
+            assert rcvbuf >= 128 * 1024, rcvbuf
+            assert sndbuf > 0, sndbuf
+            applied = mcastsocket.set_buffer_sizes(sock, rcvbuf=256 * 1024)
+            assert applied[0] >= rcvbuf, (applied, rcvbuf)
+        finally:
+            sock.close()
+
+    def test_adaptive(self):
+        sock = mcastsocket.create_socket(('', 8061), rcvbuf=4096)
+        try:
+            adaptive = buffers.AdaptiveBuffer(
+                sock, maximum=64 * 1024, interval=1.0,
+            )
+            start = adaptive.size
+            assert adaptive.update(0, now=10) is None
+            assert adaptive.update(0, now=11) is None
+            assert adaptive.update(5, now=12) is not None
+            assert adaptive.size == start * 2, adaptive.size
+            # rate limited
+            assert adaptive.update(10, now=12.5) is None
+            for now in range(13, 30):
+                adaptive.update(10 + now, now=now)
+            assert adaptive.size == 64 * 1024, adaptive.size
+            assert adaptive.total_drops == 39, adaptive.total_drops
+        finally:
+            sock.close()
+
+    def test_adaptive_capped(self):
+        sock = mcastsocket.create_socket(('', 8064), rcvbuf=4096)
+        original = mcastsocket.set_buffer_sizes
+        try:
+            adaptive = buffers.AdaptiveBuffer(sock, interval=1.0)
+            start = adaptive.size
+            # kernel refuses to go beyond 3/2 the starting size
+            mcastsocket.set_buffer_sizes = lambda sock, rcvbuf: (
+                min(rcvbuf, start * 3 // 2) * 2, 0,
+            )
+            adaptive.update(0, now=10)
+            assert adaptive.update(5, now=11) == start * 3
+            assert adaptive.size == start * 3 // 2, adaptive.size
+            assert adaptive.update(10, now=12) is None
+            assert adaptive.capped
+            assert adaptive.update(15, now=13) is None
+            assert len(adaptive.history) == 1, adaptive.history
+        finally:
+            mcastsocket.set_buffer_sizes = original
+            sock.close()
+
+    def test_drop_counters(self):
+        group = '224.1.1.13'
+        sock = mcastsocket.create_socket(('', 8062), TTL=5, rcvbuf=1024)
+        sender = mcastsocket.create_socket(('', 8063), TTL=5)
+        try:
+            space = buffers.enable_drop_counter(sock)
+            mcastsocket.join_group(sock, group, iface='127.0.0.1')
+            mcastsocket.limit_to_interface(sender, '127.0.0.1')
+            for _ in range(200):
+                sender.sendto(b'x' * 1000, (group, 8062))
+            proc = buffers.proc_drops(sock)
+            if proc is not None:
+                assert proc > 0, proc
+            readable, _, _ = select.select([sock], [], [], .5)
+            assert readable
+            _, ancdata, _, _ = sock.recvmsg(65000, space)
+            # the counter is only attached once drops have happened, the
+            # first (queued) datagram pre-dates them
+            drops = buffers.parse_drop_counter(ancdata)
+            assert drops is None or drops > 0, drops
+        finally:
+            sock.close()
+            sender.close()
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_capture
+----------------------------------
+
+Tests for `mcastsocket.capture` module.
+"""
+import gc
+import os
+import select
+import shutil
+import tempfile
+import time
+import unittest
+import warnings
+from mcastsocket import mcastsocket, capture
+
+
+class TestCapture(unittest.TestCase):
+    group = '224.1.1.10'
+    port = 8040
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'capture.pcap')
+        self.sock = mcastsocket.create_socket(('', self.port), TTL=5)
+        mcastsocket.join_group(self.sock, self.group, iface='127.0.0.1')
+        self.sender = mcastsocket.create_socket(('', 8041), TTL=5)
+        mcastsocket.limit_to_interface(self.sender, '127.0.0.1')
+
+    def tearDown(self):
+        self.sock.close()
+        self.sender.close()
+        shutil.rmtree(self.directory)
+
+    def test_record_receive(self):
+        recorder = capture.Recorder(self.path, self.sock)
+        before = time.time()
+        self.sender.sendto(b'moo', (self.group, self.port))
+        readable, _, _ = select.select([self.sock], [], [], .5)
+        assert readable, 'Nothing received'
+        data, address = recorder.receive()
+        assert data == b'moo', data
+        recorder.close()
+
+        replay = capture.Replay(self.path)
+        try:
+            assert len(replay) == 1
+            record = replay[0]
+            assert record.source == ('127.0.0.1', 8041), record
+            assert record.destination == (self.group, self.port), record
+            assert bytes(record.payload) == b'moo', record
+            assert before - 1 < record.timestamp < time.time() + 1, record
+        finally:
+            replay.close()
+        # closing with a live payload view is complete, and idempotent
+        assert replay.map is None and replay.stream.closed
+        replay.close()
+
+    def test_replay(self):
+        recorder = capture.Recorder(self.path)
+        for index in range(10):
+            recorder.record(
+                b'%d' % (index,), ('10.0.0.1', 5000),
+                ('224.9.9.9', 5000), 1000.0 + index * .01,
+            )
+        recorder.close()
+        # re-opening appends rather than re-writing the header
+        recorder = capture.Recorder(self.path)
+        recorder.record(b'10', ('10.0.0.1', 5000), ('224.9.9.9', 5000), 1000.1)
+        recorder.close()
+
+        replay = capture.Replay(self.path)
+        try:
+            assert len(replay) == 11, len(replay)
+            assert replay.start_time == 1000.0
+            start = replay.seek(1000.045)
+            assert start == 5, start
+
+            began = time.time()
+            sent = replay.replay(
+                self.sender, address=(self.group, self.port),
+                speed=2.0, start=start,
+            )
+            elapsed = time.time() - began
+            assert sent == 6, sent
+            assert elapsed >= .02, elapsed
+            received = []
+            while True:
+                readable, _, _ = select.select([self.sock], [], [], .2)
+                if not readable:
+                    break
+                received.append(self.sock.recv(65000))
+            assert received == [b'5', b'6', b'7', b'8', b'9', b'10'], received
+
+            assert replay.replay(
+                self.sender, address=(self.group, self.port), speed=None,
+            ) == 11
+        finally:
+            replay.close()
+
+    def test_invalid(self):
+        header = capture.PCAP_HEADER
+        for content in (
+            b'short',
+            header.pack(0xa1b2c3d4, 2, 4, 0, 0, 65535, capture.LINKTYPE_RAW),
+            header.pack(capture.PCAP_MAGIC_NS, 2, 4, 0, 0, 65535, 1),
+        ):
+            with open(self.path, 'wb') as stream:
+                stream.write(content)
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                try:
+                    capture.Replay(self.path)
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError('Accepted %r' % (content,))
+                gc.collect()
+            # the file (and mapping) were closed rather than leaked
+            assert not caught, [str(w.message) for w in caught]
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
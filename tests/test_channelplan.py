@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_channelplan
+----------------------------------
+
+Tests for `mcastsocket.channelplan` module.
+"""
+import select
+import socket
+import unittest
+from mcastsocket import mcastsocket, channelplan
+
+
+class TestChannelPlan(unittest.TestCase):
+
+    def send(self, group, port, message):
+        sock = mcastsocket.create_socket(('', 8089), TTL=5)
+        mcastsocket.limit_to_interface(sock, '127.0.0.1')
+        sock.sendto(message, (group, port))
+        sock.close()
+
+    def test_validation(self):
+        try:
+            channelplan.ChannelPlan([
+                ('224.1.1.20', 8080, '127.0.0.1'),
+                ('10.0.0.1', 8080),
+                ('224.1.1.21', 70000),
+                ('not-an-ip', 8080),
+                {'group': '224.1.1.22', 'port': 8080, 'iface': 'bogus'},
+                ('ff02::1', 8080, '', '::1'),
+            ])
+        except channelplan.PlanError as err:
+            assert [index for index, _, _ in err.errors] == [1, 2, 3, 4, 5], (
+                err.errors
+            )
+        else:
+            raise AssertionError('Invalid plan accepted')
+
+    def test_ttl_conflict(self):
+        try:
+            channelplan.ChannelPlan([
+                ('224.1.1.20', 8080, '127.0.0.1', None, 1),
+                ('224.1.1.21', 8080, '127.0.0.1', None, 1),
+                ('224.1.1.22', 8080, '127.0.0.1', None, 32),
+                ('224.1.1.23', 8081, '127.0.0.1', None, 32),
+            ])
+        except channelplan.PlanError as err:
+            assert [index for index, _, _ in err.errors] == [2], err.errors
+            assert 'TTL 32' in str(err), err
+        else:
+            raise AssertionError('Conflicting TTLs accepted')
+
+    def test_layout(self):
+        plan = channelplan.ChannelPlan([
+            ('224.1.1.20', 8080, '127.0.0.1', None, 5),
+            ('224.1.1.21', '8080', '127.0.0.1', None, '5'),
+            ('224.1.1.20', 8080, '127.0.0.1', None, 5),
+            channelplan.Channel('224.1.1.22', 8081, '127.0.0.1'),
+        ])
+        assert len(plan.resolved) == 3, plan.resolved
+        layout = plan.layout()
+        assert list(layout.keys()) == [
+            (socket.AF_INET, 8080), (socket.AF_INET, 8081),
+        ], layout
+        assert plan.channels[1].ttl == 5, plan.channels[1]
+
+    def test_open(self):
+        plan = channelplan.ChannelPlan([
+            ('224.1.1.20', 8080, '127.0.0.1'),
+            ('224.1.1.21', 8080, '127.0.0.1'),
+            ('224.1.1.22', 8081, '127.0.0.1'),
+        ])
+        opened = plan.open()
+        try:
+            assert len(opened.sockets()) == 2
+            for group, port in (
+                ('224.1.1.20', 8080), ('224.1.1.21', 8080),
+                ('224.1.1.22', 8081),
+            ):
+                self.send(group, port, group.encode('ascii'))
+                sock = opened.socket_for(group, port)
+                readable, _, _ = select.select([sock], [], [], .5)
+                assert readable, 'Nothing received on %s' % (group,)
+                assert sock.recv(65000) == group.encode('ascii')
+        finally:
+            opened.close()
+        assert opened.sockets() == []
+
+    def test_rollback(self):
+        created = []
+
+        class RecordingPlan(channelplan.OpenPlan):
+            def add(self, family, port, sock):
+                created.append(sock)
+                super(RecordingPlan, self).add(family, port, sock)
+        original = channelplan.OpenPlan
+        channelplan.OpenPlan = RecordingPlan
+        try:
+            plan = channelplan.ChannelPlan([
+                ('224.1.1.20', 8080, '127.0.0.1'),
+                # valid address, but not one of ours so the join fails
+                ('224.1.1.21', 8082, '192.0.2.1'),
+            ])
+            self.assertRaises(socket.error, plan.open)
+        finally:
+            channelplan.OpenPlan = original
+        assert len(created) == 2, created
+        assert all(sock.fileno() == -1 for sock in created), created
+
+    def test_rollback_bind(self):
+        created = []
+
+        class RecordingPlan(channelplan.OpenPlan):
+            def add(self, family, port, sock):
+                created.append(sock)
+                super(RecordingPlan, self).add(family, port, sock)
+        blocker = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        blocker.bind(('', 8084))
+        original = channelplan.OpenPlan
+        channelplan.OpenPlan = RecordingPlan
+        try:
+            plan = channelplan.ChannelPlan([
+                ('224.1.1.20', 8080, '127.0.0.1'),
+                ('224.1.1.23', 8084, '127.0.0.1'),
+            ], reuse=False)
+            self.assertRaises(socket.error, plan.open)
+        finally:
+            channelplan.OpenPlan = original
+            blocker.close()
+        assert len(created) == 2, created
+        assert all(sock.fileno() == -1 for sock in created), created
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
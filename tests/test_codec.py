@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_codec
+----------------------------------
+
+Tests for `mcastsocket.codec` module.
+"""
+import select
+import unittest
+from mcastsocket import mcastsocket, codec
+
+HEADER = codec.Schema([
+    ('version', 'B'),
+    ('flags', 'B'),
+    ('sequence', 'I'),
+    ('timestamp', 'd'),
+])
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_schema(self):
+        assert HEADER.size == 14, HEADER.size
+        assert HEADER.offsets['sequence'][0] == 2
+        assert HEADER.offsets['timestamp'][0] == 6
+        self.assertRaises(ValueError, codec.Schema, [('a', 'B'), ('a', 'B')])
+        self.assertRaises(ValueError, codec.Schema, [('payload', 'B')])
+        self.assertRaises(ValueError, codec.Schema, [('a', '2H'), ('b', 'B')])
+        self.assertRaises(
+            ValueError, codec.Schema, [('a', 'B'), ('b', 'I')], byteorder='@',
+        )
+        schema = codec.Schema([('a', 'B'), ('name', '4s'), ('b', 'I')], '<')
+        message = schema.decode(bytes(
+            schema.encoder().pack((1, b'abcd', 2))
+        ))
+        assert message.b == 2 and message.name == b'abcd', message
+        assert message.as_dict() == {'a': 1, 'name': b'abcd', 'b': 2}
+
+    def test_round_trip(self):
+        encoder = HEADER.encoder(size=64)
+        data = encoder.encode(
+            b'hello', version=1, flags=2, sequence=3, timestamp=4.5,
+        )
+        assert len(data) == HEADER.size + 5
+        message = HEADER.decode(bytes(data))
+        assert message.sequence == 3, message.sequence
+        assert message._values is None, 'Should decode lazily'
+        assert message.timestamp == 4.5
+        assert bytes(message.payload) == b'hello'
+        assert message.values() == (1, 2, 3, 4.5)
+        assert message.as_dict()['flags'] == 2
+        self.assertRaises(TypeError, encoder.encode, b'', version=1)
+        self.assertRaises(
+            TypeError, encoder.encode, b'',
+            version=1, flags=2, sequence=3, timestamp=4.5, sequnce=3,
+        )
+        self.assertRaises(ValueError, encoder.pack, (1, 2, 3, 4.5), b'x' * 64)
+        self.assertRaises(ValueError, HEADER.decode, b'short')
+
+    def test_send_receive(self):
+        group = '224.1.1.8'
+        sock = mcastsocket.create_socket(('', 8020), TTL=5)
+        try:
+            mcastsocket.join_group(sock, group, iface='127.0.0.1')
+            encoder = HEADER.encoder()
+            encoder.sendto(
+                sock, (group, 8020), b'moo',
+                version=1, flags=0, sequence=42, timestamp=1.0,
+            )
+            readable, _, _ = select.select([sock], [], [], .5)
+            assert readable, 'Nothing received'
+            message, address = HEADER.decoder().recvfrom(sock)
+            assert message.sequence == 42, message
+            assert bytes(message.payload) == b'moo', message
+        finally:
+            sock.close()
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_demux
+----------------------------------
+
+Tests for `mcastsocket.demux` module.
+"""
+import select
+import unittest
+from mcastsocket import mcastsocket, demux
+
+
+class TestDemux(unittest.TestCase):
+
+    def send(self, group, message, port=8010):
+        sock = mcastsocket.create_socket(('', 8011), TTL=5)
+        mcastsocket.limit_to_interface(sock, '127.0.0.1')
+        sock.sendto(message, (group, port))
+        sock.close()
+
+    def test_recv_pktinfo(self):
+        sock = mcastsocket.create_socket(('', 8010), TTL=5)
+        try:
+            demux.enable_pktinfo(sock)
+            mcastsocket.join_group(sock, '224.1.1.4', iface='127.0.0.1')
+            self.send('224.1.1.4', b'moo')
+            readable, _, _ = select.select([sock], [], [], .5)
+            assert readable, 'Nothing received'
+            data, address, group, ifindex = demux.recv_pktinfo(sock)
+            assert data == b'moo', data
+            assert group == '224.1.1.4', group
+            assert ifindex == mcastsocket.if_nametoindex('lo'), ifindex
+        finally:
+            sock.close()
+
+    def test_dispatch(self):
+        sock = mcastsocket.create_socket(('', 8010), TTL=5)
+        received = []
+        unknown = []
+
+        def handler(data, address, group, ifindex):
+            received.append((data, group))
+
+        def default(data, address, group, ifindex):
+            unknown.append((data, group))
+        try:
+            mux = demux.Demultiplexer(sock, default=default)
+            mux.join_group('224.1.1.5', handler, iface='127.0.0.1')
+            mux.join_group('224.1.1.6', handler, iface='127.0.0.1')
+            mcastsocket.join_group(sock, '224.1.1.7', iface='127.0.0.1')
+            self.send('224.1.1.5', b'first')
+            self.send('224.1.1.6', b'second')
+            self.send('224.1.1.7', b'third')
+            select.select([mux], [], [], .5)
+            assert mux.receive() == 3
+            assert received == [
+                (b'first', '224.1.1.5'), (b'second', '224.1.1.6'),
+            ], received
+            assert unknown == [(b'third', '224.1.1.7')], unknown
+            assert mux.receive() == 0
+            mux.leave_group('224.1.1.5', iface='127.0.0.1')
+            assert len(mux.table) == 1, mux.table
+        finally:
+            sock.close()
+
+    def test_leave_other_interface(self):
+        sock = mcastsocket.create_socket(('', 8012), TTL=5)
+        received = []
+        try:
+            mux = demux.Demultiplexer(sock)
+            mux.join_group(
+                '224.1.1.5', lambda *args: received.append(args[0]),
+                iface='127.0.0.1',
+            )
+            mux.join_group(
+                '224.1.1.5', lambda *args: received.append(args[0]),
+                iface='0.0.0.0',
+            )
+            mux.leave_group('224.1.1.5', iface='0.0.0.0')
+            assert len(mux.table) == 1, 'Handler removed while still joined'
+            self.send('224.1.1.5', b'still', port=8012)
+            select.select([mux], [], [], .5)
+            assert mux.receive() == 1
+            assert received == [b'still'], received
+            mux.leave_group('224.1.1.5', iface='127.0.0.1')
+            assert mux.table == {}, mux.table
+        finally:
+            sock.close()
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_liveness
+----------------------------------
+
+Tests for `mcastsocket.liveness` module.
+"""
+import struct
+import unittest
+from mcastsocket import liveness
+
+
+class TestLiveness(unittest.TestCase):
+
+    def test_wheel(self):
+        wheel = liveness.TimerWheel(tick=.01, slots=8, now=0)
+        wheel.schedule('a', .05)
+        wheel.schedule('b', .5)
+        wheel.schedule('c', .03)
+        assert wheel.advance(.02) == []
+        assert wheel.advance(.04) == ['c']
+        # lazy push-back of a's deadline
+        wheel.schedule('a', .2)
+        assert wheel.advance(.1) == []
+        assert wheel.advance(.2) == ['a']
+        assert wheel.cancel('b')
+        assert wheel.advance(1.0) == []
+        assert len(wheel) == 0
+
+    def test_wheel_earlier(self):
+        wheel = liveness.TimerWheel(tick=.01, slots=8, now=0)
+        wheel.schedule('a', .5)
+        wheel.schedule('a', .02)
+        assert wheel.advance(.02) == ['a']
+        assert wheel.advance(1.0) == []
+
+    def test_tracker(self):
+        events = []
+        tracker = liveness.LivenessTracker(
+            timeout=.3,
+            on_down=lambda p: events.append(('down', p.source)),
+            on_up=lambda p: events.append(('up', p.source)),
+            sequence=lambda data: struct.unpack('!I', data[:4])[0],
+            now=0,
+        )
+        sources = [('10.0.0.%d' % (i,), 5000) for i in range(1, 1001)]
+        for source in sources:
+            tracker.observe(struct.pack('!I', 0), source, now=0.0)
+        assert len(events) == 1000
+        assert len(tracker.alive()) == 1000
+        del events[:]
+        # everyone but the first keeps talking
+        for step in range(1, 5):
+            now = step * .1
+            for source in sources[1:]:
+                tracker.observe(struct.pack('!I', step), source, now=now)
+            tracker.poll(now)
+        assert events == [('down', sources[0])], events
+        # a publisher with a gap in its sequence
+        publisher = tracker.observe(struct.pack('!I', 7), sources[1], now=.45)
+        assert publisher.lost == 2, publisher
+        # comes back
+        del events[:]
+        tracker.observe(struct.pack('!I', 9), sources[0], now=.5)
+        assert events == [('up', sources[0])], events
+        assert tracker.publishers[sources[0]].lost == 0
+        # a long-running publisher (4995 lost on the way) restarts within
+        # the timeout from sequence 0, later loss is still counted
+        tracker.observe(struct.pack('!I', 5000), sources[2], now=.5)
+        tracker.observe(struct.pack('!I', 0), sources[2], now=.51)
+        publisher = tracker.observe(struct.pack('!I', 3), sources[2], now=.52)
+        assert publisher.lost == 2 + 4995, publisher
+        # everyone goes silent
+        assert len(tracker.poll(2.0)) == 1000
+        assert tracker.alive() == []
+        assert tracker.forget(sources[0]) is not None
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
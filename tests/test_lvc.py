@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_lvc
+----------------------------------
+
+Tests for `mcastsocket.lvc` module.
+"""
+import os
+import select
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from mcastsocket import mcastsocket, lvc
+
+
+def key(data):
+    return bytes(data[:4])
+
+
+class TestLastValueCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = lvc.LastValueCache(key, capacity=3)
+        for message in (b'aaaa1', b'bbbb1', b'cccc1', b'aaaa2', b'dddd1'):
+            cache.update(memoryview(message))
+        assert len(cache) == 3
+        assert b'bbbb' not in cache, 'Least recently updated not evicted'
+        assert cache.get(b'aaaa') == b'aaaa2'
+        assert cache.snapshot() == [b'cccc1', b'aaaa2', b'dddd1']
+        assert cache.evicted == 1
+
+    def test_max_bytes(self):
+        cache = lvc.LastValueCache(key, max_bytes=20)
+        for index in range(10):
+            cache.update(b'%04d' % (index,) + b'x' * 6)
+        assert len(cache) == 2, len(cache)
+        assert cache.bytes == 20, cache.bytes
+        assert cache.update(b'x') is not None
+        cache = lvc.LastValueCache(lambda data: None)
+        assert cache.update(b'ignored') is None
+        assert len(cache) == 0
+
+
+class TestCacheNode(unittest.TestCase):
+    group = '224.1.1.23'
+    port = 8090
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sock = mcastsocket.create_socket(('', self.port), TTL=5)
+        mcastsocket.join_group(self.sock, self.group, iface='127.0.0.1')
+        self.sender = mcastsocket.create_socket(('', 8091), TTL=5)
+        mcastsocket.limit_to_interface(self.sender, '127.0.0.1')
+
+    def tearDown(self):
+        self.sock.close()
+        self.sender.close()
+        shutil.rmtree(self.directory)
+
+    def check_node(self, address):
+        node = lvc.CacheNode(self.sock, lvc.LastValueCache(key), address)
+        thread = threading.Thread(target=node.serve, args=(.05,))
+        thread.start()
+        try:
+            for message in (b'aaaa1', b'bbbb1', b'aaaa2'):
+                self.sender.sendto(message, (self.group, self.port))
+            # a late joiner sees the current value per key
+            for _ in range(20):
+                snapshot = lvc.fetch_snapshot(node.address)
+                if len(snapshot) == 2:
+                    break
+                select.select([], [], [], .05)
+            assert snapshot == [b'bbbb1', b'aaaa2'], snapshot
+            assert node.snapshots >= 1
+        finally:
+            node.stop()
+            thread.join()
+            node.close()
+
+    def test_unix(self):
+        self.check_node(os.path.join(self.directory, 'lvc.sock'))
+
+    def test_tcp(self):
+        self.check_node(('127.0.0.1', 0))
+
+    def test_stalled_client(self):
+        cache = lvc.LastValueCache(key)
+        # far more than the socket buffers hold
+        for index in range(200):
+            cache.update(b'%04d' % (index,) + b'x' * 65000)
+        node = lvc.CacheNode(
+            self.sock, cache, ('127.0.0.1', 0),
+            send_timeout=.2, transfers=1,
+        )
+        stalled = socket.create_connection(node.address)
+        try:
+            # connects but never reads, the transfer blocks
+            thread = node.serve_snapshot()
+            late = socket.create_connection(node.address)
+            assert node.serve_snapshot() is None
+            assert node.rejected == 1
+            late.close()
+            # until the send times out, freeing the transfer slot
+            thread.join(2.0)
+            assert not thread.is_alive()
+            again = socket.create_connection(node.address)
+            thread = node.serve_snapshot()
+            again.close()
+            assert thread is not None
+            thread.join(2.0)
+        finally:
+            stalled.close()
+            node.close()
+
+    def test_unix_stale(self):
+        path = os.path.join(self.directory, 'lvc.sock')
+        node = lvc.CacheNode(self.sock, lvc.LastValueCache(key), path)
+        try:
+            # a live node's path is not stolen
+            self.assertRaises(
+                socket.error,
+                lvc.CacheNode, self.sock, lvc.LastValueCache(key), path,
+            )
+        finally:
+            # leaves the path behind, as a crashed node would
+            node.listener.close()
+        node = lvc.CacheNode(self.sock, lvc.LastValueCache(key), path)
+        node.close()
+        # nor is anything which isn't a socket
+        with open(path, 'w') as stream:
+            stream.write('precious')
+        self.assertRaises(
+            socket.error,
+            lvc.CacheNode, self.sock, lvc.LastValueCache(key), path,
+        )
+        with open(path) as stream:
+            assert stream.read() == 'precious'
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
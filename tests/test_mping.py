@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_mping
+----------------------------------
+
+Tests for `mcastsocket.mping` module.
+"""
+import random
+import threading
+import time
+import unittest
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from mcastsocket import mcastsocket, mping, perf
+
+
+class TestMping(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = mping.Histogram(precision=.01)
+        size = len(histogram.counts)
+        values = [random.uniform(.001, .1) for _ in range(20000)]
+        for value in values:
+            histogram.add(value)
+        assert len(histogram.counts) == size, 'Histogram grew'
+        values.sort()
+        for fraction in (.5, .9, .99):
+            exact = values[int(fraction * len(values)) - 1]
+            approximate = histogram.percentile(fraction)
+            assert abs(approximate - exact) / exact < .02, (
+                fraction, exact, approximate,
+            )
+        assert histogram.percentile(1.0) == values[-1]
+        assert histogram.low == values[0]
+        assert abs(histogram.mean - sum(values) / len(values)) < 1e-9
+        histogram.add(1000.0)
+        assert histogram.counts[-1] == 1
+        histogram.reset()
+        assert histogram.percentile(.5) is None
+
+    def test_probe_stats(self):
+        stats = mping.ProbeStats()
+        for sequence in (0, 1, 3, 2, 5):
+            stats.update(sequence, .001)
+        assert stats.received == 5
+        assert stats.late == 1
+        assert stats.lost == 1, stats.lost
+        assert 'lost 1' in stats.report(), stats.report()
+
+    def test_loopback(self):
+        probe, reply = ('224.1.1.14', 8070), ('224.1.1.15', 8071)
+        responder_sock = mcastsocket.create_socket(('', probe[1]), TTL=5)
+        initiator_sock = mcastsocket.create_socket(('', reply[1]), TTL=5)
+        try:
+            mcastsocket.join_group(responder_sock, probe[0], iface='127.0.0.1')
+            mcastsocket.join_group(initiator_sock, reply[0], iface='127.0.0.1')
+            responder = mping.Responder(responder_sock, reply)
+            thread = threading.Thread(target=responder.serve, args=(1.0,))
+            thread.start()
+            reports = []
+            initiator = mping.Initiator(initiator_sock, probe, rate=200)
+            initiator.run(count=50, interval=.1, report=reports.append)
+            thread.join()
+            assert responder.replies == 50, responder.replies
+            ((address, stats),) = initiator.responders.items()
+            assert address[0] == '127.0.0.1', address
+            assert stats.received == 50, stats.report()
+            assert stats.lost == 0, stats.report()
+            assert stats.histogram.percentile(.99) < .5, stats.report()
+            assert reports, 'No interval reports'
+        finally:
+            responder_sock.close()
+            initiator_sock.close()
+
+    def test_command_line(self):
+        common = [
+            '224.1.1.16', '8072', '--reply-group', '224.1.1.17',
+            '--iface', '127.0.0.1', '--loop',
+        ]
+        parser = perf.get_options()
+        echo_options = parser.parse_args(
+            ['echo'] + common + ['--duration', '1'],
+        )
+        ping_options = parser.parse_args(
+            ['ping'] + common + ['--count', '20', '--rate', '100'],
+        )
+        echo_options.reply_port = ping_options.reply_port = 8073
+        output = StringIO()
+        thread = threading.Thread(
+            target=perf.echo, args=(echo_options, output),
+        )
+        thread.start()
+        time.sleep(.1)
+        initiator = perf.ping(ping_options, output)
+        thread.join()
+        assert initiator.sequence == 20
+        assert 'received 20 lost 0' in output.getvalue(), output.getvalue()
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_netwatch
+----------------------------------
+
+Tests for `mcastsocket.netwatch` module.
+"""
+import select
+import socket
+import time
+import unittest
+from mcastsocket import mcastsocket, netwatch
+
+
+class StubSource(object):
+    """Event source which replays queued events"""
+
+    def __init__(self):
+        self.events = []
+        self.reader, self.writer = socket.socketpair()
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def push(self, *events):
+        self.events.extend(events)
+
+    def read(self):
+        events, self.events = self.events, []
+        return events
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+def rtattr(kind, payload):
+    length = netwatch.RTATTR.size + len(payload)
+    padding = b'\0' * (netwatch._align(length) - length)
+    return netwatch.RTATTR.pack(length, kind) + payload + padding
+
+
+def nlmsg(kind, body):
+    return netwatch.NLMSGHDR.pack(
+        netwatch.NLMSGHDR.size + len(body), kind, 0, 0, 0
+    ) + body
+
+
+class TestNetwatch(unittest.TestCase):
+
+    def test_parse_link(self):
+        data = nlmsg(
+            netwatch.RTM_NEWLINK,
+            netwatch.IFINFOMSG.pack(
+                0, 1, 4, netwatch.IFF_UP | netwatch.IFF_RUNNING, 0
+            ) + rtattr(netwatch.IFLA_IFNAME, b'eth0\0'),
+        ) + nlmsg(
+            netwatch.RTM_NEWLINK,
+            netwatch.IFINFOMSG.pack(0, 1, 4, 0, 0)
+            + rtattr(netwatch.IFLA_IFNAME, b'eth0\0'),
+        )
+        up, down = netwatch.parse_messages(data, timestamp=1.0)
+        assert up == (netwatch.LINK_UP, 4, 'eth0', None, 1.0), up
+        assert down.kind == netwatch.LINK_DOWN, down
+
+    def test_parse_addr(self):
+        data = nlmsg(
+            netwatch.RTM_DELADDR,
+            netwatch.IFADDRMSG.pack(socket.AF_INET, 24, 0, 0, 4)
+            + rtattr(netwatch.IFA_LOCAL, socket.inet_aton('10.0.0.5'))
+            + rtattr(netwatch.IFA_LABEL, b'eth0\0'),
+        )
+        (event,) = netwatch.parse_messages(data)
+        assert event.kind == netwatch.ADDR_DEL, event
+        assert event.address == '10.0.0.5', event
+        assert event.name == 'eth0', event
+
+    def test_netlink_source(self):
+        try:
+            source = netwatch.NetlinkSource()
+        except (socket.error, AttributeError) as err:
+            raise unittest.SkipTest('No rtnetlink available: %s' % (err,))
+        try:
+            assert isinstance(source.read(), list)
+        finally:
+            source.close()
+
+    def test_rejoin(self):
+        group = '224.1.1.3'
+        source = StubSource()
+        watcher = netwatch.Watcher(source=source)
+        sock = mcastsocket.create_socket(('', 8002), TTL=5)
+        try:
+            watcher.join_group(sock, group, iface='127.0.0.1')
+            # simulate the kernel dropping our membership with the address
+            mcastsocket.leave_group(sock, group, iface='127.0.0.1')
+            down = netwatch.LinkEvent(
+                netwatch.ADDR_DEL, 1, 'lo', '127.0.0.1', time.time()
+            )
+            up = netwatch.LinkEvent(
+                netwatch.ADDR_ADD, 1, 'lo', '127.0.0.1', time.time()
+            )
+            source.push(down, up)
+            lost, rejoined = watcher.process()
+            assert lost.action == 'lost', lost
+            assert rejoined.action == 'rejoined', rejoined
+            assert rejoined.latency >= 0, rejoined
+            assert rejoined.downtime >= 0, rejoined
+            assert list(watcher.log) == [lost, rejoined]
+
+            # an up event for a healthy membership doesn't leave/re-join
+            records = watcher.process([
+                netwatch.LinkEvent(netwatch.LINK_UP, 1, 'lo', None, 3.0),
+            ])
+            assert records == [], records
+            # unrelated interfaces are ignored
+            records = watcher.process([
+                netwatch.LinkEvent(netwatch.LINK_DOWN, 99, 'x', None, 4.0),
+            ])
+            assert records == [], records
+
+            sender = mcastsocket.create_socket(('', 8003), TTL=5)
+            mcastsocket.limit_to_interface(sender, '127.0.0.1')
+            sender.sendto(b'moo', (group, 8002))
+            sender.close()
+            readable, _, _ = select.select([sock], [], [], .5)
+            assert readable, 'Membership was not re-applied'
+            assert sock.recvfrom(65000)[0] == b'moo'
+
+            watcher.leave_group(sock, group, iface='127.0.0.1')
+            assert watcher.memberships == [], watcher.memberships
+        finally:
+            sock.close()
+            watcher.close()
+
+    def test_link_flap(self):
+        index = netwatch.address_indices().get('127.0.0.1')
+        if index is None:
+            raise unittest.SkipTest('No rtnetlink available')
+        group = '224.1.1.99'
+        source = StubSource()
+        watcher = netwatch.Watcher(source=source)
+        sock = mcastsocket.create_socket(('', 8004), TTL=5)
+        try:
+            membership = watcher.join_group(sock, group, iface='127.0.0.1')
+            assert membership.index == index, membership.index
+            # address is kept, only the link goes down and comes back
+            down = netwatch.LinkEvent(
+                netwatch.LINK_DOWN, index, 'lo', None, 1.0,
+            )
+            up = netwatch.LinkEvent(netwatch.LINK_UP, index, 'lo', None, 2.0)
+            lost, intact = watcher.process([down, up])
+            assert lost.action == 'lost', lost
+            assert intact.action == 'intact', intact
+            # attribute-only changes repeat the up state
+            assert watcher.process([up]) == []
+            (lost,) = watcher.process([down])
+            mcastsocket.leave_group(sock, group, iface='127.0.0.1')
+            (rejoined,) = watcher.process([up])
+            assert rejoined.action == 'rejoined', rejoined
+        finally:
+            sock.close()
+            watcher.close()
+
+    def test_index_cache(self):
+        dumps = []
+        original = netwatch.address_indices
+
+        def address_indices():
+            dumps.append(True)
+            return {'127.0.0.1': 1}
+        netwatch.address_indices = address_indices
+        watcher = netwatch.Watcher(source=StubSource())
+        sock = mcastsocket.create_socket(('', 8006), TTL=5)
+        try:
+            for group in ('224.1.1.96', '224.1.1.97'):
+                membership = watcher.join_group(sock, group, '127.0.0.1')
+                assert membership.index == 1, membership.index
+            assert len(dumps) == 1, dumps
+            # addresses learned from events need no dump at all
+            watcher.process([
+                netwatch.LinkEvent(netwatch.ADDR_ADD, 7, 'x', '10.7.7.7', 1.0),
+            ])
+            assert watcher.interface_index(sock, '10.7.7.7') == 7
+            assert len(dumps) == 1, dumps
+        finally:
+            netwatch.address_indices = original
+            sock.close()
+            watcher.close()
+
+    def test_wildcard(self):
+        group = '224.1.1.98'
+        source = StubSource()
+        watcher = netwatch.Watcher(source=source)
+        sock = mcastsocket.create_socket(('', 8005), TTL=5)
+        try:
+            membership = watcher.join_group(sock, group)
+            records = watcher.process([
+                netwatch.LinkEvent(
+                    netwatch.ADDR_DEL, 99, 'veth9', '10.9.9.9', 1.0,
+                ),
+                netwatch.LinkEvent(netwatch.LINK_UP, 99, 'veth9', None, 2.0),
+            ])
+            # still joined, so neither lost nor left and re-joined
+            assert records == [], records
+            assert membership.down_since is None
+        finally:
+            sock.close()
+            watcher.close()
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
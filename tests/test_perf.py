@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_perf
+----------------------------------
+
+Tests for `mcastsocket.perf` module.
+"""
+import threading
+import time
+import unittest
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from mcastsocket import perf, mping
+
+
+class TestPerf(unittest.TestCase):
+
+    def message(self, sequence, sender=1, timestamp=None):
+        encoder = perf.HEADER.encoder()
+        data = encoder.pack((
+            perf.MAGIC, sender, sequence,
+            time.time() if timestamp is None else timestamp,
+        ))
+        return perf.HEADER.decode(bytes(data))
+
+    def test_receive_stats(self):
+        stats = perf.ReceiveStats()
+        for sequence in (0, 1, 3, 2, 4, 7):
+            stats.update(self.message(sequence), 24, time.time())
+        stats.update(self.message(10, sender=2), 24, time.time())
+        assert stats.packets == 7, stats.packets
+        assert stats.reordered == 1, stats.reordered
+        assert stats.lost == 2, stats.lost
+        report = stats.report(time.time(), 1.0)
+        assert 'lost 2' in report, report
+        assert 'reordered 1' in report, report
+
+    def test_latencies(self):
+        stats = perf.ReceiveStats()
+        now = time.time()
+        for sequence in range(100):
+            stats.update(
+                self.message(sequence, timestamp=now - .002), 24, now,
+            )
+        assert stats.latencies.count == 100, stats.latencies.count
+        assert 'p50 2.00ms' in stats.report(now, 1.0)
+        stats.reset(now)
+        assert stats.latencies.count == 0
+        assert 'p50 - ' in stats.report(now, 1.0)
+
+    def test_size_defaults(self):
+        parser = perf.get_options()
+        options = parser.parse_args(['send', '224.1.1.11', '8050'])
+        assert options.size == perf.HEADER.size, options.size
+        options = parser.parse_args(
+            ['ping', '224.1.1.11', '8050', '--reply-group', '224.1.1.12'],
+        )
+        assert options.size == mping.HEADER.size, options.size
+
+    def test_send_recv(self):
+        common = [
+            '224.1.1.11', '8050', '--iface', '127.0.0.1', '--loop',
+            '--interval', '.1',
+        ]
+        parser = perf.get_options()
+        recv_options = parser.parse_args(
+            ['recv'] + common + ['--count', '50', '--duration', '2'],
+        )
+        send_options = parser.parse_args(
+            ['send'] + common + ['--count', '50', '--rate', '500',
+                                 '--size', '100'],
+        )
+        output = StringIO()
+        results = []
+        receiver = threading.Thread(
+            target=lambda: results.append(perf.recv(recv_options, output)),
+        )
+        receiver.start()
+        time.sleep(.1)
+        assert perf.send(send_options, StringIO()) == 50
+        receiver.join()
+        assert results == [50], results
+        assert 'recv' in output.getvalue(), output.getvalue()
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_publisher
+----------------------------------
+
+Tests for `mcastsocket.publisher` module.
+"""
+import select
+import threading
+import unittest
+from mcastsocket import mcastsocket, publisher
+
+
+class GatedPublisher(publisher.Publisher):
+    """Publisher whose sender waits for the test to open the gate"""
+
+    def __init__(self, *args, **named):
+        self.gate = threading.Event()
+        super(GatedPublisher, self).__init__(*args, **named)
+
+    def send(self, messages):
+        self.gate.wait()
+        return super(GatedPublisher, self).send(messages)
+
+
+class TestPublisher(unittest.TestCase):
+    group = '224.1.1.9'
+    port = 8030
+
+    def setUp(self):
+        self.receiver = mcastsocket.create_socket(('', self.port), TTL=5)
+        mcastsocket.join_group(self.receiver, self.group, iface='127.0.0.1')
+        self.sender = mcastsocket.create_socket(('', 8031), TTL=5)
+        mcastsocket.limit_to_interface(self.sender, '127.0.0.1')
+
+    def tearDown(self):
+        self.receiver.close()
+        self.sender.close()
+
+    def receive_all(self):
+        messages = []
+        while True:
+            readable, _, _ = select.select([self.receiver], [], [], .2)
+            if not readable:
+                return messages
+            messages.append(self.receiver.recv(65000))
+
+    def producers(self, pub, count=3, messages=50):
+        def produce(name):
+            for index in range(messages):
+                pub.publish(('%s:%d' % (name, index)).encode('ascii'))
+        names = ['p%d' % (i,) for i in range(count)]
+        threads = [
+            threading.Thread(target=produce, args=(name,), name=name)
+            for name in names
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def check_order(self, pub, received, count=3, messages=50):
+        assert len(received) == count * messages, len(received)
+        for name in ['p%d' % (i,) for i in range(count)]:
+            indices = [
+                int(message.split(b':')[1]) for message in received
+                if message.split(b':')[0] == name.encode('ascii')
+            ]
+            assert indices == list(range(messages)), (name, indices)
+        names = sorted(stats.name for stats in pub.producers)
+        assert names == ['p0', 'p1', 'p2'], names
+        assert all(s.published == messages for s in pub.producers)
+
+    def test_sendmmsg(self):
+        if publisher.get_sendmmsg() is None:
+            raise unittest.SkipTest('No sendmmsg in C library')
+        pub = publisher.Publisher(
+            self.sender, (self.group, self.port), batch=16,
+        )
+        self.producers(pub)
+        assert pub.flush(2.0)
+        self.check_order(pub, self.receive_all())
+        assert pub.sent == 150, pub.sent
+        pub.close()
+        self.assertRaises(RuntimeError, pub.publish, b'late')
+
+    def test_sendto_fallback(self):
+        pub = publisher.Publisher(
+            self.sender, (self.group, self.port), use_sendmmsg=False,
+        )
+        self.producers(pub)
+        pub.close()
+        self.check_order(pub, self.receive_all())
+
+    def check_bad_address(self, pub):
+        self.assertRaises(ValueError, pub.publish, b'nowhere')
+        pub.publish(b'first', (self.group, self.port))
+        pub.publish(b'bad', ('not-an-ip', self.port))
+        pub.publish(b'last', (self.group, self.port))
+        pub.gate.set()
+        pub.close()
+        # the bad message doesn't take the rest of its batch with it
+        assert sorted(self.receive_all()) == [b'first', b'last']
+        assert (pub.sent, pub.errors) == (2, 1), (pub.sent, pub.errors)
+
+    def test_bad_address(self):
+        if publisher.get_sendmmsg() is None:
+            raise unittest.SkipTest('No sendmmsg in C library')
+        self.check_bad_address(GatedPublisher(self.sender))
+
+    def test_bad_address_sendto(self):
+        self.check_bad_address(
+            GatedPublisher(self.sender, use_sendmmsg=False),
+        )
+
+    def test_drop_overflow(self):
+        pub = GatedPublisher(
+            self.sender, (self.group, self.port),
+            capacity=2, overflow=publisher.DROP,
+        )
+        results = [pub.publish(b'%d' % (i,)) for i in range(5)]
+        # sender may hold one batch (of up to 2) while the queue refills
+        assert results[:2] == [True, True], results
+        assert results.count(False) >= 1, results
+        stats = pub.stats()
+        assert stats.dropped == results.count(False), stats
+        pub.gate.set()
+        pub.close()
+        assert len(self.receive_all()) == results.count(True)
+
+    def test_block_timeout(self):
+        pub = GatedPublisher(
+            self.sender, (self.group, self.port), capacity=1, timeout=.05,
+        )
+        assert pub.publish(b'first')
+        assert not pub.publish(b'second')
+        assert pub.stats().blocked == 1
+        assert not pub.flush(.05)
+        pub.gate.set()
+        pub.close()
+
+    def test_close_race(self):
+        pub = publisher.Publisher(self.sender, (self.group, self.port))
+        accepted = []
+
+        def produce():
+            for index in range(1000):
+                try:
+                    pub.publish(b'%d' % (index,))
+                except RuntimeError:
+                    return
+                accepted.append(index)
+        thread = threading.Thread(target=produce)
+        thread.start()
+        pub.close(2.0)
+        thread.join()
+        assert not pub.thread.is_alive()
+        # everything accepted before close was sent
+        assert pub.completed == len(accepted), (pub.completed, len(accepted))
+        assert pub.flush(.1)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())